@@ -0,0 +1,42 @@
+from hashlib import md5
+
+from django.db.models import Count, Max
+from django.utils.cache import parse_etags
+
+from recipes.cache import RECIPES_DELETED_KEY, get_timestamp, user_flags_key
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def matches_etag(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or strip_weak(etag) in map(strip_weak, etags)
+
+
+def recipe_stats(queryset):
+    return queryset.aggregate(
+        count=Count('id'), last_id=Max('id'), updated_at=Max('updated_at')
+    )
+
+
+def recipe_validators(request, stats, deletions=False):
+    timestamps = []
+    if deletions:
+        timestamps.append(get_timestamp(RECIPES_DELETED_KEY))
+    if stats['updated_at'] is not None:
+        timestamps.append(stats['updated_at'].timestamp())
+    if request.user.is_authenticated:
+        timestamps.append(get_timestamp(user_flags_key(request.user.pk)))
+    state = (
+        request.get_full_path(), request.user.pk,
+        stats['count'], stats['last_id'], timestamps,
+    )
+    etag = '"%s"' % md5(repr(state).encode()).hexdigest()
+    return etag, int(max(timestamps, default=0))
+
+
+def data_etag(request, data):
+    state = (request.get_full_path(), request.user.pk, data)
+    return '"%s"' % md5(repr(state).encode()).hexdigest()
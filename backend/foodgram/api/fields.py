@@ -0,0 +1,86 @@
+import base64
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.images import rendition_names
+
+
+class Base64ImageField(serializers.ImageField):
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'invalid_base64': 'Некорректная строка base64.',
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'too_many_pixels': (
+            'Изображение не должно превышать {max_pixels} пикселей.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:image'):
+            format, imgstr = data.split(';base64,')
+            ext = format.split('/')[-1]
+            data = self.decode(imgstr, 'temp.' + ext, format[len('data:'):])
+        return super().to_internal_value(data)
+
+    def decode(self, imgstr, name, content_type):
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        if len(imgstr) // 4 * 3 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+        upload = TemporaryUploadedFile(name, content_type, 0, None)
+        leftover = ''
+        try:
+            for start in range(0, len(imgstr), self.chunk_size):
+                chunk = leftover + ''.join(
+                    imgstr[start:start + self.chunk_size].split()
+                )
+                usable = len(chunk) // 4 * 4
+                upload.write(base64.b64decode(chunk[:usable]))
+                leftover = chunk[usable:]
+            if leftover:
+                upload.write(base64.b64decode(leftover))
+        except ValueError:
+            upload.close()
+            self.fail('invalid_base64')
+        upload.size = upload.tell()
+        if upload.size > max_size:
+            upload.close()
+            self.fail('too_large', max_size=max_size)
+        upload.seek(0)
+        try:
+            with Image.open(upload) as image:
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            width = height = 0
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            upload.close()
+            self.fail('too_many_pixels', max_pixels=settings.MAX_IMAGE_PIXELS)
+        upload.seek(0)
+        return upload
+
+
+class ImageRenditionsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'image')
+        super().__init__(**kwargs)
+
+    def to_representation(self, image):
+        if not image:
+            return None
+        request = self.context.get('request')
+        renditions = {}
+        # Renditions are made by create_image_renditions, so a new image
+        # has none until its next run.
+        for size, formats in rendition_names(image.name).items():
+            for extension, name in formats.items():
+                if not default_storage.exists(name):
+                    continue
+                url = default_storage.url(name)
+                renditions.setdefault(size, {})[extension] = (
+                    request.build_absolute_uri(url) if request else url
+                )
+        return renditions or None
@@ -1,16 +1,35 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import (BooleanField, Case, Exists, ExpressionWrapper,
+                              IntegerField, OuterRef, Q, Value, When)
+from django.db.models.functions import Replace, Upper
 from django_filters import rest_framework as filters
 from rest_framework.exceptions import ValidationError
 
-from recipes.models import Ingredient, Recipe
+from api.pagination import RecipeCursorPagination
+from recipes.cache import TAGS_VERSION_KEY, VersionedValue
+from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag
+from recipes.pantry import pantry_index
 from users.models import User
 
+tag_ids = VersionedValue(
+    TAGS_VERSION_KEY,
+    lambda: dict(Tag.objects.values_list('slug', 'id')),
+)
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_ids.get()[1]]
+
 
 class RecipeFilter(filters.FilterSet):
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all()
     )
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='with_tags',
     )
     is_favorited = filters.BooleanFilter(
         method='favorite',
@@ -18,31 +37,116 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='cart',
     )
+    search = filters.CharFilter(
+        method='full_text',
+    )
+    pantry = filters.BaseInFilter(
+        method='cookable',
+    )
+    pantry_missing = filters.NumberFilter(
+        method='cookable_missing',
+    )
 
     class Meta:
         model = Recipe
         fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
 
+    def with_tags(self, queryset, name, value):
+        slugs = tag_ids.get()[1]
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag__in=[slugs[slug] for slug in value if slug in slugs],
+            )
+        ))
+
     def favorite(self, queryset, name, value):
         user = self.request.user
         if not user.is_authenticated:
+            if not value:
+                return queryset
             raise ValidationError(
                 "Авторизируйся, что бы иметь право фильтровать избранное."
             )
-        return queryset.filter(favorite__user=user)
+        return self.with_user_flag(queryset, Favorite, value)
 
     def cart(self, queryset, name, value):
         user = self.request.user
         if not user.is_authenticated:
+            if not value:
+                return queryset
             raise ValidationError(
                 "Авторизируйся, что бы иметь право фильтровать покупки."
             )
-        return queryset.filter(cart__user=user)
+        return self.with_user_flag(queryset, Cart, value)
+
+    def with_user_flag(self, queryset, model, value):
+        flag = Exists(model.objects.filter(
+            user=self.request.user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(flag if value else ~flag)
+
+    def full_text(self, queryset, name, value):
+        return queryset.search(value)
+
+    def cookable(self, queryset, name, value):
+        try:
+            ingredient_ids = [int(pk) for pk in value]
+        except ValueError:
+            raise ValidationError(
+                {'pantry': 'Укажите id ингредиентов через запятую.'}
+            )
+        max_missing = self.form.cleaned_data.get('pantry_missing')
+        if max_missing is None:
+            max_missing = settings.PANTRY_MAX_MISSING
+        elif not 0 <= max_missing <= settings.PANTRY_MAX_MISSING:
+            raise ValidationError({'pantry_missing': (
+                'Допустимо от 0 до '
+                f'{settings.PANTRY_MAX_MISSING} недостающих ингредиентов.'
+            )})
+        if RecipeCursorPagination.cursor_query_param in self.request.GET:
+            raise ValidationError({'pantry': (
+                'Подбор по продуктам сортирует рецепты по числу недостающих '
+                'ингредиентов и не поддерживает параметр cursor.'
+            )})
+        tiers = defaultdict(list)
+        # Other filters have already run; check the index results against
+        # what they kept, or the limit could cut off every recipe they allow.
+        allowed = None
+        if queryset.query.has_filters():
+            def allowed(recipe_ids):
+                return set(queryset.filter(pk__in=recipe_ids).order_by(
+                ).values_list('pk', flat=True))
+        for recipe_id, missing in pantry_index.search(
+            ingredient_ids, int(max_missing), settings.PANTRY_RESULTS_LIMIT,
+            allowed,
+        ):
+            tiers[missing].append(recipe_id)
+        return queryset.filter(
+            pk__in=[pk for recipe_ids in tiers.values() for pk in recipe_ids]
+        ).annotate(missing=Case(
+            *(When(pk__in=recipe_ids, then=Value(missing))
+              for missing, recipe_ids in tiers.items()),
+            output_field=IntegerField(),
+        )).order_by('missing', '-pk')
+
+    def cookable_missing(self, queryset, name, value):
+        return queryset
 
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(lookup_expr='icontains')
+    name = filters.CharFilter(method='search')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def search(self, queryset, name, value):
+        value = value.upper().replace('Ё', 'Е')
+        return queryset.annotate(
+            search_name=Replace(Upper('name'), Value('Ё'), Value('Е'))
+        ).filter(search_name__contains=value).annotate(
+            is_prefix=ExpressionWrapper(
+                Q(search_name__startswith=value), output_field=BooleanField()
+            )
+        ).order_by('-is_prefix', 'name')[:settings.INGREDIENT_SEARCH_LIMIT]
@@ -0,0 +1,101 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from rest_framework import serializers
+
+from api.response_cache import stats as response_cache_stats
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@contextmanager
+def timed(request, name):
+    timing = getattr(request, '_timing', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing[name] = (
+                timing.get(name, 0.0) + time.perf_counter() - start
+            )
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with timed(self.context.get('request'), 'serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.total:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(Histogram)
+        self.db_durations = defaultdict(Histogram)
+        self.queries = defaultdict(int)
+
+    def observe(self, route, method, duration, db_duration, queries):
+        key = (route, method)
+        with self._lock:
+            self.durations[key].observe(duration)
+            self.db_durations[key].observe(db_duration)
+            self.queries[key] += queries
+
+    def render(self):
+        lines = [
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (route, method), histogram in sorted(self.durations.items()):
+                lines.extend(histogram.lines(
+                    'foodgram_request_duration_seconds',
+                    f'route="{route}",method="{method}"',
+                ))
+            lines.append('# TYPE foodgram_db_duration_seconds histogram')
+            for (route, method), histogram in sorted(
+                self.db_durations.items()
+            ):
+                lines.extend(histogram.lines(
+                    'foodgram_db_duration_seconds',
+                    f'route="{route}",method="{method}"',
+                ))
+            lines.append('# TYPE foodgram_db_queries_total counter')
+            for (route, method), queries in sorted(self.queries.items()):
+                lines.append(
+                    'foodgram_db_queries_total'
+                    f'{{route="{route}",method="{method}"}} {queries}'
+                )
+        for name, value in response_cache_stats().items():
+            metric = f'foodgram_response_cache_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
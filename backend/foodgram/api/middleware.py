@@ -0,0 +1,106 @@
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from api.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if duration * 1000 >= settings.SLOW_QUERY_MS:
+                self.slow.append((duration, sql))
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        request._timing = {}
+        start = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = self.header(request, recorder, start)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, recorder, start
+            )
+        else:
+            self.finish(request, recorder, start)
+        return response
+
+    @staticmethod
+    @contextmanager
+    def recording(recorder):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            yield
+
+    def stream(self, content, request, recorder, start):
+        try:
+            with self.recording(recorder):
+                yield from content
+        finally:
+            self.finish(request, recorder, start)
+
+    @staticmethod
+    def header(request, recorder, start):
+        end = time.perf_counter()
+        timing = request._timing
+        view_end = timing.get('view', end)
+        serialize = timing.get('serialize', 0.0)
+        view = view_end - start - serialize
+        render = timing.get('render', view_end) - view_end + serialize
+        return ', '.join((
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries"',
+            f'view;dur={view * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={(end - start) * 1000:.1f}',
+        ))
+
+    @staticmethod
+    def finish(request, recorder, start):
+        for duration, sql in sorted(recorder.slow, reverse=True):
+            logger.warning(
+                'Slow query (%.1f ms) on %s: %s',
+                duration * 1000, request.path, sql,
+            )
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else 'unmatched', request.method,
+            time.perf_counter() - start, recorder.duration, recorder.count,
+        )
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing['view'] = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: timing.update(render=time.perf_counter())
+            )
+        return response
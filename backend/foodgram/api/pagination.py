@@ -0,0 +1,13 @@
+from django.core.paginator import Paginator
+from rest_framework.pagination import CursorPagination
+
+
+class CountedPaginator(Paginator):
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+class RecipeCursorPagination(CursorPagination):
+    ordering = '-id'
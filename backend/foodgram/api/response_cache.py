@@ -0,0 +1,67 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import urlencode
+
+from recipes.autocomplete import VERSION_KEY as INGREDIENTS_VERSION_KEY
+from recipes.cache import (AUTHORS_VERSION_KEY, RECIPES_VERSION_KEY,
+                           TAGS_VERSION_KEY, get_version, recipe_version_key)
+
+HITS_KEY = 'response_cache_hits'
+MISSES_KEY = 'response_cache_misses'
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def normalize_query(query_params):
+    return urlencode(sorted(
+        (key, sorted(values)) for key, values in query_params.lists()
+    ), doseq=True)
+
+
+def cache_key(request, recipe_id=None):
+    if recipe_id is None:
+        version_key = RECIPES_VERSION_KEY
+    else:
+        version_key = recipe_version_key(recipe_id)
+    state = (
+        request.build_absolute_uri(request.path),
+        normalize_query(request.query_params),
+        [
+            get_version(key) for key in (
+                version_key, TAGS_VERSION_KEY,
+                INGREDIENTS_VERSION_KEY, AUTHORS_VERSION_KEY,
+            )
+        ],
+    )
+    return 'response:%s' % md5(repr(state).encode()).hexdigest()
+
+
+def count(key):
+    cache = response_cache()
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_cached(key):
+    entry = response_cache().get(key)
+    count(MISSES_KEY if entry is None else HITS_KEY)
+    return entry
+
+
+def set_cached(key, entry):
+    response_cache().set(key, entry)
+
+
+def stats():
+    counters = response_cache().get_many((HITS_KEY, MISSES_KEY))
+    return {
+        'hits': counters.get(HITS_KEY, 0),
+        'misses': counters.get(MISSES_KEY, 0),
+    }
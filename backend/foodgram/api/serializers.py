@@ -1,23 +1,13 @@
-
-import base64
-
-from django.core.files.base import ContentFile
+from django.db import transaction
 from rest_framework import serializers
 
-from recipes.models import (Cart, Favorite, Ingredient, IngridientForRecipe,
-                            Recipe, Tag)
+from api.fields import Base64ImageField, ImageRenditionsField
+from api.metrics import TimedListSerializer, TimedSerializerMixin
+from recipes.models import (Cart, CartTotal, Favorite, Ingredient,
+                            IngridientForRecipe, Recipe, Tag)
 from users.serializers import CustomUserSerializer
 
 
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
-
-
 class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -54,33 +44,36 @@ class IngridientInRecipe(serializers.ModelSerializer):
     )
 
 
-class RecipeSerilizers(serializers.ModelSerializer):
+class RecipeSerilizers(TimedSerializerMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = IngridientInRecipe(many=True, source='ingredient_for_recipe')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_renditions',
+            'text', 'cooking_time'
         ]
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Cart.objects.filter(
-                user=user, recipe=obj).exists()
-        return False
+        return self.get_user_flag(obj, 'in_shopping_cart', Cart)
 
     def get_is_favorited(self, obj):
+        return self.get_user_flag(obj, 'favorited', Favorite)
+
+    def get_user_flag(self, obj, annotation, model):
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         user = self.context.get('request').user
         if user.is_authenticated:
-            return Favorite.objects.filter(
-                user=user, recipe=obj).exists()
+            return model.objects.filter(user=user, recipe=obj).exists()
         return False
 
 
@@ -101,6 +94,17 @@ class FavoriteSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class AddIngredientSerializer(serializers.ModelSerializer):
 
     id = serializers.IntegerField()
@@ -131,18 +135,59 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         ]
 
+    def validate_ingredients(self, value):
+        ids = [ingredient['id'] for ingredient in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.'
+            )
+        ingredients = Ingredient.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in ingredients]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}.'
+            )
+        return [
+            {'ingredient': ingredients[item['id']], 'amount': item['amount']}
+            for item in value
+        ]
+
     @staticmethod
     def create_ingredients_amounts(ingredients, recipe):
-        ingredient_objects = []
-        for ingredient_data in ingredients:
-            ingredient = Ingredient.objects.get(id=ingredient_data['id'])
-            amount = ingredient_data['amount']
-            ingredient_for_recipe = IngridientForRecipe(
-                ingredient=ingredient, recipe=recipe, amount=amount)
-            ingredient_objects.append(ingredient_for_recipe)
-
-        IngridientForRecipe.objects.bulk_create(ingredient_objects)
+        IngridientForRecipe.objects.bulk_create([
+            IngridientForRecipe(recipe=recipe, **ingredient)
+            for ingredient in ingredients
+        ])
+
+    def update_ingredients_amounts(self, ingredients, recipe):
+        existing = {
+            row.ingredient_id: row
+            for row in recipe.ingredient_for_recipe.all()
+        }
+        to_create = []
+        to_update = []
+        for ingredient in ingredients:
+            row = existing.pop(ingredient['ingredient'].id, None)
+            if row is None:
+                to_create.append(ingredient)
+            elif row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                to_update.append(row)
+        if existing:
+            IngridientForRecipe.objects.filter(
+                id__in=[row.id for row in existing.values()]
+            ).delete()
+        if to_update:
+            IngridientForRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            self.create_ingredients_amounts(to_create, recipe)
+        CartTotal.objects.refresh_recipe_on_commit(
+            recipe,
+            [row.ingredient_id for row in to_update]
+            + [ingredient['ingredient'].id for ingredient in to_create],
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
@@ -153,16 +198,29 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                                         ingredients=ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients_amounts(recipe=instance,
-                                        ingredients=ingredients)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients_amounts(recipe=instance,
+                                            ingredients=ingredients)
         return super().update(instance, validated_data)
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
+        user = self.context.get('request').user
+        instance = Recipe.objects.with_related().with_user_flags(
+            user
+        ).get(pk=instance.pk)
         return RecipeSerilizers(instance,
                                 context=self.context).data
@@ -0,0 +1,66 @@
+import csv
+import json
+from datetime import datetime
+
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class ShoppingListContentNegotiation(DefaultContentNegotiation):
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def txt_rows(user, ingredients):
+    today = datetime.today()
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n\n'
+        f'Дата: {today:%Y-%m-%d}\n\n'
+    )
+    separator = ''
+    for ingredient in ingredients:
+        yield (
+            f'{separator}- {ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]})'
+            f' - {ingredient["cart_amount"]}'
+        )
+        separator = '\n'
+    yield f'\n\nFoodgram ({today:%Y})'
+
+
+def csv_rows(user, ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['cart_amount'],
+        ))
+
+
+def json_rows(user, ingredients):
+    yield '{"user": %s, "date": "%s", "ingredients": [' % (
+        json.dumps(user.get_full_name(), ensure_ascii=False),
+        f'{datetime.today():%Y-%m-%d}',
+    )
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['cart_amount'],
+        }, ensure_ascii=False)
+        separator = ', '
+    yield ']}'
+
+
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', txt_rows),
+    'csv': ('text/csv; charset=utf-8', csv_rows),
+    'json': ('application/json', json_rows),
+}
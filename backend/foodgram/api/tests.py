@@ -0,0 +1,471 @@
+import base64
+import csv
+import io
+import json
+import os
+import textwrap
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APITestCase
+
+from api.fields import Base64ImageField
+from api.metrics import registry
+from recipes.models import (Cart, Favorite, Ingredient, IngridientForRecipe,
+                            Recipe, Tag)
+from recipes.pantry import pantry_index
+from recipes.search import search_recipes
+from recipes.testing import RecipeFixtures, count_queries
+
+
+class RecipeListTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = [
+            self.create_recipe(name=f'recipe{number}') for number in range(6)
+        ]
+        Favorite.objects.create(user=self.user, recipe=self.recipes[-1])
+        Cart.objects.create(user=self.user, recipe=self.recipes[-2])
+        self.client.force_authenticate(self.user)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for page_size in (2, 6):
+            with mock.patch.object(
+                PageNumberPagination, 'page_size', page_size
+            ), self.assertNumQueries(6):
+                response = self.client.get('/api/recipes/')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_filters_run_once(self):
+        with mock.patch('recipes.models.search_recipes',
+                        wraps=search_recipes) as search:
+            response = self.client.get('/api/recipes/', {'search': 'recipe'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(search.call_count, 1)
+
+    def test_cursor_pages_skip_the_feed_aggregate(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/', {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
+        response = self.client.get(
+            '/api/recipes/', {'cursor': ''},
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_user_flags(self):
+        response = self.client.get('/api/recipes/')
+        flags = {
+            recipe['id']: (recipe['is_favorited'],
+                           recipe['is_in_shopping_cart'])
+            for recipe in response.data['results']
+        }
+        self.assertEqual(flags[self.recipes[-1].pk], (True, False))
+        self.assertEqual(flags[self.recipes[-2].pk], (False, True))
+        self.assertEqual(flags[self.recipes[0].pk], (False, False))
+
+
+class RecipeFilterTests(RecipeFixtures, APITestCase):
+    def ids(self, params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(response.data['results']))
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_tags_match_any_without_duplicates(self):
+        both = self.create_recipe(tags=self.tags)
+        first = self.create_recipe(tags=self.tags[:1])
+        self.create_recipe(tags=[])
+        self.assertEqual(
+            self.ids({'tags': ['tag0', 'tag1']}), [first.pk, both.pk]
+        )
+        self.assertEqual(self.ids({'tags': 'tag1'}), [both.pk])
+
+    def test_user_flag_filters(self):
+        favorite, other = self.create_recipe(), self.create_recipe()
+        Favorite.objects.create(user=self.user, recipe=favorite)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.ids({'is_favorited': 1}), [favorite.pk])
+        self.assertEqual(self.ids({'is_favorited': 0}), [other.pk])
+        self.assertEqual(self.ids({'is_in_shopping_cart': 1}), [])
+
+
+class ResponseCacheTests(RecipeFixtures, APITestCase):
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_pages_are_cached_until_recipes_change(self):
+        recipe = self.create_recipe(name='old')
+        for path in ('/api/recipes/', f'/api/recipes/{recipe.pk}/'):
+            self.assertEqual(self.get(path)['X-Cache'], 'MISS')
+            self.assertEqual(self.get(path)['X-Cache'], 'HIT')
+        recipe.name = 'new'
+        recipe.save()
+        response = self.get('/api/recipes/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['name'], 'new')
+        self.get(f'/api/recipes/{recipe.pk}/')
+        IngridientForRecipe.objects.create(
+            recipe=recipe, ingredient=self.ingredients[5], amount=1
+        )
+        response = self.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['ingredients']), 4)
+
+    def test_authenticated_pages_bypass_the_cache(self):
+        self.create_recipe()
+        self.client.force_authenticate(self.user)
+        self.assertFalse(self.get('/api/recipes/').has_header('X-Cache'))
+
+
+class RecipeDetailTests(RecipeFixtures, APITestCase):
+    def test_query_count_does_not_grow_with_related_rows(self):
+        self.client.force_authenticate(self.user)
+        small = self.create_recipe(self.ingredients[:1], tags=self.tags[:1])
+        large = self.create_recipe(self.ingredients, tags=self.tags)
+        response, small_queries = count_queries(
+            self.client, f'/api/recipes/{small.pk}/'
+        )
+        self.assertEqual(len(response.data['ingredients']), 1)
+        response, large_queries = count_queries(
+            self.client, f'/api/recipes/{large.pk}/'
+        )
+        self.assertEqual(len(response.data['ingredients']), 8)
+        self.assertEqual(len(response.data['tags']), 2)
+        self.assertEqual(small_queries, large_queries)
+
+
+class RecipeIngredientWriteTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe(self.ingredients[:3])
+        self.client.force_authenticate(self.user)
+
+    def patch_ingredients(self, *amounts):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts
+            ]},
+            format='json',
+        )
+
+    def rows(self):
+        return {
+            ingredient: (pk, amount)
+            for pk, ingredient, amount in IngridientForRecipe.objects.filter(
+                recipe=self.recipe
+            ).values_list('pk', 'ingredient', 'amount')
+        }
+
+    def test_update_keeps_unchanged_rows(self):
+        kept, changed, removed = self.ingredients[:3]
+        added = self.ingredients[3]
+        before = self.rows()
+        response = self.patch_ingredients(
+            (kept, 10), (changed, 25), (added, 5)
+        )
+        self.assertEqual(response.status_code, 200)
+        after = self.rows()
+        self.assertEqual(set(after), {kept.pk, changed.pk, added.pk})
+        self.assertEqual(after[kept.pk], before[kept.pk])
+        self.assertEqual(after[changed.pk], (before[changed.pk][0], 25))
+        self.assertEqual(after[added.pk][1], 5)
+
+    def test_rejects_duplicate_and_unknown_ingredients(self):
+        ingredient = self.ingredients[0]
+        unknown = Ingredient(pk=ingredient.pk + 1000)
+        for amounts in (
+            [(ingredient, 1), (ingredient, 2)], [(unknown, 1)]
+        ):
+            response = self.patch_ingredients(*amounts)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('ingredients', response.data)
+        self.assertEqual(len(self.rows()), 3)
+
+
+class UserRecipeToggleTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.client.force_authenticate(self.user)
+
+    def test_toggles_are_idempotent(self):
+        for name, model in (('favorite', Favorite),
+                            ('shopping_cart', Cart)):
+            path = f'/api/recipes/{self.recipe.pk}/{name}/'
+            self.assertEqual(self.client.post(path).status_code, 201)
+            self.assertEqual(self.client.post(path).status_code, 400)
+            self.assertEqual(model.objects.count(), 1)
+            self.assertEqual(self.client.delete(path).status_code, 204)
+            self.assertEqual(self.client.delete(path).status_code, 400)
+            self.assertFalse(model.objects.exists())
+            missing = f'/api/recipes/{self.recipe.pk + 1}/{name}/'
+            self.assertEqual(self.client.post(missing).status_code, 404)
+
+    def test_duplicates_are_rejected_by_the_database(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+
+
+class UserRecipeBatchTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe(name=f'recipe{number}')
+                        for number in range(2)]
+        self.client.force_authenticate(self.user)
+
+    def change(self, method, path, recipe_ids):
+        response = getattr(self.client, method)(
+            path, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {result['id']: result['status']
+                for result in response.data['results']}
+
+    def test_reports_status_per_recipe(self):
+        first, second = (recipe.pk for recipe in self.recipes)
+        missing = second + 1
+        for name, model in (('favorite', Favorite),
+                            ('shopping_cart', Cart)):
+            path = f'/api/recipes/{name}/'
+            model.objects.create(user=self.user, recipe=self.recipes[0])
+            self.assertEqual(
+                self.change('post', path, [first, second, missing, second]),
+                {first: 'exists', second: 'added', missing: 'not_found'},
+            )
+            self.assertEqual(model.objects.filter(user=self.user).count(), 2)
+            model.objects.filter(recipe=self.recipes[0]).delete()
+            self.assertEqual(
+                self.change('delete', path, [first, second, missing]),
+                {first: 'absent', second: 'removed', missing: 'not_found'},
+            )
+            self.assertFalse(model.objects.exists())
+
+    def test_rejects_invalid_payload(self):
+        for payload in ({}, {'recipes': []}, {'recipes': ['x']},
+                        {'recipes': list(range(1, 102))}):
+            response = self.client.post(
+                '/api/recipes/favorite/', payload, format='json'
+            )
+            self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': [1]}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ShoppingListTests(RecipeFixtures, APITestCase):
+    path = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format):
+        response = self.client.get(self.path, {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_formats_sum_amounts_across_recipes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for ingredients, amount in (
+                (self.ingredients[:2], 10), (self.ingredients[1:3], 5)
+            ):
+                Cart.objects.create(user=self.user, recipe=self.create_recipe(
+                    ingredients, amount=amount
+                ))
+        expected = [
+            ['ingredient0', 'г', 10],
+            ['ingredient1', 'г', 15],
+            ['ingredient2', 'г', 5],
+        ]
+        data = json.loads(self.download('json'))
+        self.assertEqual(data['user'], 'Имя Фамилия')
+        self.assertEqual(
+            [[row['name'], row['measurement_unit'], row['amount']]
+             for row in data['ingredients']],
+            expected,
+        )
+        rows = list(csv.reader(io.StringIO(self.download('csv'))))
+        self.assertEqual(rows[0], ['name', 'measurement_unit', 'amount'])
+        self.assertEqual(
+            rows[1:], [[name, unit, str(amount)]
+                       for name, unit, amount in expected]
+        )
+        self.assertIn('- ingredient1 (г) - 15', self.download('txt'))
+
+    def test_rejects_unknown_format_and_empty_cart(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 400)
+        Cart.objects.create(user=self.user, recipe=self.create_recipe())
+        response = self.client.get(self.path, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PantryFilterTests(RecipeFixtures, APITestCase):
+    @override_settings(PANTRY_RESULTS_LIMIT=1)
+    def test_limit_applies_after_author_filter(self):
+        mine = self.create_recipe(name='mine')
+        self.create_recipe(name='theirs', author=self.create_user('other'))
+        pantry_index.reset()
+        pantry = ','.join(
+            str(ingredient.pk) for ingredient in self.ingredients[:3]
+        )
+        response = self.client.get('/api/recipes/', {'pantry': pantry})
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get(
+            '/api/recipes/', {'pantry': pantry, 'author': self.user.pk}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']], [mine.pk]
+        )
+
+    def test_rejects_cursor_pagination(self):
+        response = self.client.get(
+            '/api/recipes/', {'pantry': self.ingredients[0].pk, 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pantry', response.data)
+
+
+class TagListTests(RecipeFixtures, APITestCase):
+    def test_etag_changes_with_tags(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(len(response.data), 2)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name='tag2', slug='tag2', color='#000002')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class IngredientSearchTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('Ёжевика', 'ежевичный джем', 'Мёд'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def names(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_index_folds_yo(self):
+        self.assertEqual(
+            self.names('ЕЖЕВ'), ['Ёжевика', 'ежевичный джем']
+        )
+        self.assertEqual(self.names('мед'), ['Мёд'])
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'UPPER() folds only ASCII on SQLite')
+    @override_settings(INGREDIENT_SEARCH_INDEX=False)
+    def test_database_search_folds_yo(self):
+        self.assertCountEqual(
+            self.names('ЕЖЕВ'), ['Ёжевика', 'ежевичный джем']
+        )
+        self.assertEqual(self.names('мед'), ['Мёд'])
+
+
+class Base64ImageFieldTests(APITestCase):
+    def decode(self, imgstr):
+        field = Base64ImageField()
+        field.chunk_size = 1000
+        upload = field.decode(imgstr, 'temp.png', 'image/png')
+        try:
+            return upload.read()
+        finally:
+            upload.close()
+
+    def test_decodes_wrapped_base64_across_chunks(self):
+        raw = os.urandom(10000)
+        encoded = base64.b64encode(raw).decode()
+        self.assertEqual(self.decode(encoded), raw)
+        self.assertEqual(
+            self.decode('\r\n'.join(textwrap.wrap(encoded, 76))), raw
+        )
+        self.assertEqual(self.decode(' '.join(encoded)), raw)
+
+    def test_rejects_invalid_base64(self):
+        for imgstr in ('abc', 'абвг'):
+            with self.assertRaises(ValidationError):
+                self.decode(imgstr)
+
+
+class ImageRenditionTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media()
+        self.client.force_authenticate(self.user)
+
+    def test_renditions_are_listed_once_created(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'PNG')
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 1}],
+            'tags': [self.tags[0].pk],
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(buffer.getvalue()).decode(),
+            'name': 'recipe',
+            'text': 'text',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['image_renditions'])
+        call_command('create_image_renditions', stdout=io.StringIO())
+        response = self.client.get(f'/api/recipes/{response.data["id"]}/')
+        renditions = response.data['image_renditions']
+        self.assertEqual(set(renditions), {'240', '960'})
+        for formats in renditions.values():
+            self.assertEqual(set(formats), {'webp', 'jpeg'})
+
+
+@override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+class ServerTimingTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_recipe()
+
+    def test_header_is_staff_only(self):
+        self.assertFalse(
+            self.client.get('/api/recipes/').has_header('Server-Timing')
+        )
+        self.client.force_authenticate(self.user)
+        self.assertFalse(
+            self.client.get('/api/recipes/').has_header('Server-Timing')
+        )
+        self.user.is_staff = True
+        self.user.save()
+        timing = self.client.get('/api/recipes/')['Server-Timing']
+        for metric in ('db', 'view', 'render', 'total'):
+            self.assertIn(f'{metric};dur=', timing)
+
+    def test_streamed_queries_are_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.create(user=self.user, recipe=Recipe.objects.get())
+        self.client.force_authenticate(self.user)
+        key = ('recipe-download-shopping-cart', 'GET')
+        before = registry.queries.get(key, 0)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(registry.queries.get(key, 0), before)
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'ingredient0', content)
+        self.assertGreater(registry.queries[key], before)
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, metrics
 from users.views import UserViewSet
 
 router = routers.DefaultRouter()
@@ -11,6 +11,7 @@ router.register(r'recipes', RecipeViewSet)
 router.register(r'ingredients', IngredientViewSet)
 
 urlpatterns = [
+    path('_metrics', metrics, name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path(r'auth/', include('djoser.urls.authtoken')),
@@ -1,20 +1,43 @@
-from datetime import datetime
+from functools import partial
 
-from django.db.models import Sum, OuterRef, Subquery
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django_filters import rest_framework as filters
 from rest_framework import permissions, status, viewsets
 from rest_framework.permissions import SAFE_METHODS
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from api.conditional import (data_etag, matches_etag, recipe_stats,
+                             recipe_validators)
 from api.filter import IngredientFilter, RecipeFilter
-from recipes.models import (Cart, Favorite, Ingredient, IngridientForRecipe,
-                            Recipe, Tag)
+from api.metrics import registry
+from api.pagination import CountedPaginator, RecipeCursorPagination
+from api.response_cache import cache_key, get_cached, set_cached
+from api.shopping_list import FORMATS, ShoppingListContentNegotiation
+from recipes.autocomplete import ingredient_index
+from recipes.cache import TAGS_VERSION_KEY, VersionedValue
+from recipes.models import (Cart, CartTotal, Favorite, Ingredient, Recipe,
+                            Tag)
+from recipes.similarity import similarity_index
+from users.mixins import SubscriptionsContextMixin
+from users.serializers import RecipeAddSerializer
 
-from .serializers import (CartSerializer, CreateRecipeSerializer,
-                          FavoriteSerializer, IngredientSerializer,
-                          RecipeSerilizers, TagSerializer)
+from .serializers import (CreateRecipeSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeSerilizers,
+                          TagSerializer)
+
+
+tag_list = VersionedValue(
+    TAGS_VERSION_KEY,
+    lambda: TagSerializer(Tag.objects.all(), many=True).data,
+)
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -23,6 +46,15 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        version, tags = tag_list.get()
+        etag = f'"{version}"'
+        if matches_etag(request, etag):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+            )
+        return Response(tags, headers={'ETag': etag})
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
@@ -32,111 +64,273 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_SEARCH_INDEX:
+            return Response(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.annotate(
-        favorited=Subquery(
-            Favorite.objects.filter(
-                user=OuterRef('author'),
-                recipe=OuterRef('pk')
-            ).values('pk')[:1]
-        ),
-        in_shopping_cart=Subquery(
-            Cart.objects.filter(
-                user=OuterRef('author'),
-                recipe=OuterRef('pk')
-            ).values('pk')[:1]
-        )
-    )
+
+class RecipeViewSet(SubscriptionsContextMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.all()
+    subscription_author_field = 'author_id'
     serializer_class = RecipeSerilizers
     filter_backends = [filters.DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerilizers
         return CreateRecipeSerializer
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_param = RecipeCursorPagination.cursor_query_param
+            if cursor_param in self.request.query_params:
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def conditional(self, request, validators, render):
+        key = entry = None
+        if not request.user.is_authenticated:
+            key = cache_key(request, self.kwargs.get('pk'))
+            entry = get_cached(key)
+        if entry is None:
+            etag, last_modified = validators()
+        else:
+            etag, last_modified, data = entry
+        response = None
+        if etag is not None:
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+        if response is None:
+            if entry is not None:
+                response = Response(data)
+            else:
+                response = render()
+                if etag is None and response.status_code == 200:
+                    etag = data_etag(request, response.data)
+                if key is not None and response.status_code == 200:
+                    set_cached(key, (etag, last_modified, response.data))
+                if last_modified is None and matches_etag(request, etag):
+                    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        if key is not None:
+            response['X-Cache'] = 'MISS' if entry is None else 'HIT'
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(Recipe.objects.all())
+        stats = {}
+
+        def validators():
+            if isinstance(self.paginator, RecipeCursorPagination):
+                # Cursor pages are validated by their own content, so the
+                # feed is never aggregated as a whole.
+                return None, None
+            stats.update(recipe_stats(queryset))
+            return recipe_validators(request, stats, deletions=True)
+
+        return self.conditional(
+            request, validators, partial(self.list_page, queryset, stats)
+        )
+
+    def list_page(self, queryset, stats):
+        if 'count' in stats:
+            self.paginator.django_paginator_class = partial(
+                CountedPaginator, count=stats['count']
+            )
+        page = self.paginate_queryset(
+            queryset.with_related().with_user_flags(self.request.user)
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            queryset = Recipe.objects.filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        return self.conditional(
+            request,
+            lambda: recipe_validators(request, recipe_stats(queryset)),
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    def add_user_recipe(self, model, pk, message):
+        recipe_id = self.recipe_id(pk)
+        if model.objects.add(self.request.user, recipe_id):
+            return Response({'id': recipe_id}, status=status.HTTP_201_CREATED)
+        get_object_or_404(Recipe, pk=recipe_id)
+        return Response({'errors': message},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def remove_user_recipe(self, model, pk, message, done_message):
+        recipe_id = self.recipe_id(pk)
+        if model.objects.remove(self.request.user, recipe_id):
+            return Response({'message': done_message},
+                            status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=recipe_id)
+        return Response({'errors': message},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def change_user_recipes(self, model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            changed = model.objects.add_many(request.user, recipe_ids)
+            statuses = ('added', 'exists')
+        else:
+            changed = model.objects.remove_many(request.user, recipe_ids)
+            statuses = ('removed', 'absent')
+        results = dict.fromkeys(recipe_ids, 'not_found')
+        unchanged = set(recipe_ids) - set(changed)
+        if unchanged:
+            results.update(dict.fromkeys(
+                Recipe.objects.filter(pk__in=unchanged).values_list(
+                    'pk', flat=True
+                ),
+                statuses[1],
+            ))
+        results.update(dict.fromkeys(changed, statuses[0]))
+        return Response({'results': [
+            {'id': recipe_id, 'status': result}
+            for recipe_id, result in results.items()
+        ]})
+
+    @staticmethod
+    def recipe_id(pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
     @action(
         detail=True,
         methods=['POST'],
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        serializer = FavoriteSerializer(recipe,
-                                        data=request.data,
-                                        context={'request': request}, )
-        serializer.is_valid(raise_exception=True)
-        Favorite.objects.create(user=request.user, recipe=recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_user_recipe(Favorite, pk, 'Рецепт уже в избранном.')
 
     @favorite.mapping.delete
+    @transaction.atomic
     def favorite_delete(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        Favorite.objects.filter(user=request.user, recipe=recipe).delete()
-        return Response({'message': 'Из избранного удален'},
-                        status=status.HTTP_204_NO_CONTENT)
+        return self.remove_user_recipe(
+            Favorite, pk, 'Рецепта нет в избранном.', 'Из избранного удален'
+        )
 
     @action(detail=True, methods=['POST'],
             permission_classes=(permissions.IsAuthenticated,))
+    @transaction.atomic
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        serializer = CartSerializer(recipe,
-                                    data=request.data,
-                                    context={'request': request}, )
-        serializer.is_valid(raise_exception=True)
-        Cart.objects.create(user=request.user, recipe=recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_user_recipe(
+            Cart, pk, 'Рецепт уже в списке покупок.'
+        )
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def shoping_cart_delete(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        Cart.objects.filter(user=request.user, recipe=recipe).delete()
-        return Response({'message': 'Из рецепта удален'},
-                        status=status.HTTP_204_NO_CONTENT)
+        return self.remove_user_recipe(
+            Cart, pk, 'Рецепта нет в списке покупок.', 'Из рецепта удален'
+        )
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe, pk=self.recipe_id(pk))
+        limit = request.query_params.get(
+            'limit', str(settings.SIMILAR_RECIPES_LIMIT)
+        )
+        if not limit.isdigit() or not 0 < int(limit) <= 50:
+            raise ValidationError({'limit': 'Введите целое число от 1 до 50.'})
+        similar = similarity_index.similar(recipe, int(limit))
+        if similar is None:
+            return Response(
+                {'errors': 'Индекс похожих рецептов ещё не построен.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        recipes = Recipe.objects.previews().in_bulk(similar)
+        return Response(RecipeAddSerializer(
+            [recipes[pk] for pk in similar if pk in recipes],
+            many=True,
+            context={'request': request},
+        ).data)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    @transaction.atomic
+    def favorite_batch(self, request):
+        return self.change_user_recipes(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    @transaction.atomic
+    def shopping_cart_batch(self, request):
+        return self.change_user_recipes(Cart, request)
 
     @action(
         detail=False,
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        content_negotiation_class=ShoppingListContentNegotiation
     )
     def download_shopping_cart(self, request):
         user = request.user
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in FORMATS:
+            return Response(
+                {'format': f'Доступные форматы: {", ".join(FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         if not user.cart.exists():
-            return Response(status.HTTP_400_BAD_REQUEST)
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        ingredients = IngridientForRecipe.objects.filter(
-            recipe__cart__user=request.user
-        ).values(
+        ingredients = CartTotal.objects.filter(user=user).values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(cart_amount=Sum('amount'))
-        shopping_list = self.generate_shopping_list(user, ingredients)
+            'ingredient__measurement_unit',
+            cart_amount=F('amount'),
+        ).order_by('ingredient__name')
+        content_type, rows = FORMATS[file_format]
 
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        filename = f'{user.username}_shopping_list.{file_format}'
+        response = StreamingHttpResponse(
+            rows(user, ingredients.iterator()), content_type=content_type
+        )
         response['Content-Disposition'] = f'attachment; filename={filename}'
 
         return response
 
-    @staticmethod
-    def generate_shopping_list(user, ingredients):
-        today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
-        )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["cart_amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
-
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
 
-        return shopping_list
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def metrics(request):
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
@@ -35,6 +35,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -68,6 +69,51 @@ DATABASES = {
     }
 }
 
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+RESPONSE_CACHE_BACKEND = os.getenv(
+    'RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+
+
+def cache_options(backend):
+    # File and local-memory caches cull a share of all keys once they hold
+    # MAX_ENTRIES (300 by default), taking version tokens and ETag
+    # timestamps with them; memcached evicts by memory and takes no limit.
+    if 'memcached' in backend:
+        return {}
+    return {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000))}
+
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': cache_options(CACHE_BACKEND),
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'responses'),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600)),
+        'KEY_PREFIX': 'responses',
+        'OPTIONS': cache_options(RESPONSE_CACHE_BACKEND),
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+
+SIMILARITY_INDEX_DIR = os.getenv(
+    'SIMILARITY_INDEX_DIR', os.path.join(BASE_DIR, 'similarity_index')
+)
+SIMILAR_RECIPES_LIMIT = 10
+SIMILAR_RECIPES_MAX_DF = 0.3
+
+PANTRY_MAX_MISSING = 3
+PANTRY_RESULTS_LIMIT = 1000
+
+SERVER_TIMING_SAMPLE_RATE = float(os.getenv('SERVER_TIMING_SAMPLE_RATE', 0))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -100,6 +146,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+IMAGE_RENDITION_SIZES = (240, 960)
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -115,6 +165,9 @@ REST_FRAMEWORK = {
 
 }
 
+INGREDIENT_SEARCH_INDEX = bool(int(os.getenv('INGREDIENT_SEARCH_INDEX', '1')))
+INGREDIENT_SEARCH_LIMIT = 50
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
@@ -16,6 +16,8 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngridientForRecipe,)
+    list_display = ('id', 'name', 'author', 'favorites_count', 'carts_count')
+    list_select_related = ('author',)
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,69 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from recipes.cache import VersionedValue
+from recipes.models import Ingredient
+
+VERSION_KEY = 'ingredient_index_version'
+
+
+def normalize(value):
+    return value.lower().replace('ё', 'е')
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class IngredientIndex(VersionedValue):
+    def __init__(self):
+        super().__init__(VERSION_KEY)
+
+    def build(self):
+        items = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        keys = [item[0] for item in items]
+        grams = defaultdict(set)
+        for position, key in enumerate(keys):
+            for gram in trigrams(key):
+                grams[gram].add(position)
+        return keys, items, dict(grams)
+
+    def search(self, query, limit):
+        query = normalize(query.strip())
+        if not query:
+            return []
+        _, (keys, items, grams) = self.get()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\uffff')
+        found = list(range(start, min(end, start + limit)))
+        if len(found) < limit:
+            if len(query) < 3:
+                candidates = range(len(keys))
+            else:
+                candidates = set.intersection(
+                    *(grams.get(gram, set()) for gram in trigrams(query))
+                )
+            found += sorted(
+                (
+                    position for position in candidates
+                    if not start <= position < end
+                    and query in keys[position]
+                ),
+                key=lambda position: (keys[position].find(query), position)
+            )[:limit - len(found)]
+        return [
+            {
+                'id': items[position][1],
+                'name': items[position][2],
+                'measurement_unit': items[position][3],
+            }
+            for position in found
+        ]
+
+
+ingredient_index = IngredientIndex()
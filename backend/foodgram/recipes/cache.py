@@ -0,0 +1,64 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+TAGS_VERSION_KEY = 'tags_version'
+RECIPES_DELETED_KEY = 'recipes_deleted'
+RECIPES_VERSION_KEY = 'recipes_version'
+AUTHORS_VERSION_KEY = 'authors_version'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, uuid4().hex, None)
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe_version_{recipe_id}'
+
+
+def user_flags_key(user_id):
+    return f'recipe_flags_{user_id}'
+
+
+def get_timestamp(key):
+    timestamp = cache.get(key)
+    if timestamp is None:
+        cache.add(key, time.time(), None)
+        timestamp = cache.get(key)
+    return timestamp
+
+
+def touch_timestamp(key):
+    cache.set(key, time.time(), None)
+
+
+class VersionedValue:
+    def __init__(self, key, build=None):
+        self.key = key
+        if build is not None:
+            self.build = build
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def invalidate(self):
+        bump_version(self.key)
+
+    def get(self):
+        version = get_version(self.key)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self.build()
+                    self._version = version
+        return version, self._value
@@ -0,0 +1,53 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def count_of(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def counters(recipe_model, user_model, favorite_model, cart_model,
+             subscribe_model):
+    return {
+        recipe_model: {
+            'favorites_count': count_of(favorite_model, 'recipe'),
+            'carts_count': count_of(cart_model, 'recipe'),
+        },
+        user_model: {
+            'recipes_count': count_of(recipe_model, 'author'),
+            'subscribers_count': count_of(subscribe_model, 'author'),
+        },
+    }
+
+
+def find_drift(*models):
+    drift = {}
+    for model, fields in counters(*models).items():
+        for field, actual in fields.items():
+            drift[f'{model.__name__}.{field}'] = model.objects.annotate(
+                actual=actual
+            ).filter(~Q(**{field: F('actual')})).count()
+    return drift
+
+
+def reconcile_counters(*models):
+    for model, fields in counters(*models).items():
+        model.objects.update(**fields)
@@ -0,0 +1,64 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from recipes.storage import recipe_image_storage
+
+RENDITION_QUALITY = 80
+RENDITION_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+def rendition_name(name, size, extension):
+    stem = os.path.splitext(name)[0]
+    # Served as immutable, so anything that changes the bytes must change
+    # the name as well.
+    return f'renditions/{stem}_{size}q{RENDITION_QUALITY}.{extension}'
+
+
+def rendition_names(name):
+    return {
+        str(size): {
+            extension: rendition_name(name, size, extension)
+            for extension in RENDITION_FORMATS
+        }
+        for size in settings.IMAGE_RENDITION_SIZES
+    }
+
+
+def needs_renditions(image):
+    if not image:
+        return False
+    size = settings.IMAGE_RENDITION_SIZES[-1]
+    return (
+        not default_storage.exists(rendition_name(image.name, size, 'jpeg'))
+        and image.storage.exists(image.name)
+    )
+
+
+def create_renditions(image):
+    largest = max(settings.IMAGE_RENDITION_SIZES)
+    with image.open('rb'), Image.open(image) as original:
+        # Shrink before converting so a large upload is never held as a
+        # full-resolution RGB copy; JPEGs are downscaled while decoding.
+        original.draft('RGB', (largest, largest))
+        if original.mode in ('1', 'P'):
+            original = original.convert('RGB')
+        original.thumbnail((largest, largest))
+        original = original.convert('RGB')
+        for size in settings.IMAGE_RENDITION_SIZES:
+            thumbnail = original.copy()
+            thumbnail.thumbnail((size, size))
+            for extension, image_format in RENDITION_FORMATS.items():
+                buffer = BytesIO()
+                thumbnail.save(buffer, image_format, quality=RENDITION_QUALITY)
+                recipe_image_storage.save_once(
+                    rendition_name(image.name, size, extension),
+                    ContentFile(buffer.getvalue()),
+                )
@@ -0,0 +1,170 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, число SQL-запросов и размер ответов '
+            'основных эндпоинтов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', metavar='ENDPOINT')
+        parser.add_argument('--ingredient-query', default='мол')
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--baseline',
+            help='JSON с эталонными результатами для сравнения.',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Записать результаты в --baseline вместо сравнения.',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимое превышение задержки над эталоном (доля).',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть > 0.')
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline требует --baseline.')
+        scenarios = self.scenarios(options['ingredient_query'])
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(f'Неизвестные эндпоинты: {unknown}.')
+            scenarios = {
+                name: scenarios[name] for name in options['only']
+            }
+        results = {
+            name: self.measure(
+                user, path, params, options['requests'], options['warmup']
+            )
+            for name, (user, path, params) in scenarios.items()
+        }
+        report = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        self.stdout.write(report)
+        if not options['baseline']:
+            return
+        if options['save_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Эталон сохранён в {options["baseline"]}.'
+            ))
+            return
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = self.compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'Превышен эталон:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Эталон не превышен.'))
+
+    @staticmethod
+    def scenarios(ingredient_query):
+        recipe = Recipe.objects.order_by('-id').first()
+        if recipe is None:
+            raise CommandError('Нет рецептов, запустите seed_data.')
+        reader = User.objects.annotate(
+            subscriptions=Count('subscrib')
+        ).order_by('-subscriptions', 'id').first()
+        buyer = User.objects.annotate(
+            totals=Count('cart_totals')
+        ).order_by('-totals', 'id').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return {
+            'recipes-list-anonymous': (None, '/api/recipes/', {}),
+            'recipes-list': (reader, '/api/recipes/', {}),
+            'recipes-list-tags': (reader, '/api/recipes/', {'tags': tags}),
+            'recipes-list-cursor': (reader, '/api/recipes/', {'cursor': ''}),
+            'recipe-detail': (reader, f'/api/recipes/{recipe.id}/', {}),
+            'subscriptions': (
+                reader, '/api/users/subscriptions/', {'recipes_limit': 3}
+            ),
+            'download-shopping-cart': (
+                buyer, '/api/recipes/download_shopping_cart/', {}
+            ),
+            'ingredient-search': (
+                None, '/api/ingredients/', {'name': ingredient_query}
+            ),
+        }
+
+    @staticmethod
+    def fetch(client, path, params):
+        response = client.get(path, params)
+        if response.status_code != 200:
+            raise CommandError(f'{path} вернул {response.status_code}.')
+        if response.streaming:
+            return len(b''.join(response.streaming_content))
+        return len(response.content)
+
+    def measure(self, user, path, params, requests, warmup):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        for _ in range(warmup):
+            self.fetch(client, path, params)
+        timings = []
+        queries = []
+        sizes = []
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                sizes.append(self.fetch(client, path, params))
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+        return {
+            'requests': requests,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
+
+    @staticmethod
+    def compare(results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            for metric in LATENCY_METRICS:
+                limit = expected[metric] * (1 + tolerance)
+                if result[metric] > limit:
+                    regressions.append(
+                        f'{name}.{metric}: {result[metric]} > {limit:.2f}'
+                    )
+            if result['queries'] > expected['queries']:
+                regressions.append(
+                    f'{name}.queries: {result["queries"]} > '
+                    f'{expected["queries"]}'
+                )
+        return regressions
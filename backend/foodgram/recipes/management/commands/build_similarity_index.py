@@ -0,0 +1,33 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import DeletedRecipe
+from recipes.similarity import similarity_index
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает индекс похожих рецептов, перечитывая только '
+            'рецепты, изменённые с прошлой сборки. Запускается по '
+            'расписанию: запросы к API только подхватывают новую сборку.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Перечитать все рецепты.',
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        total = similarity_index.rebuild(full=options['full'])
+        DeletedRecipe.objects.prune()
+        message = (
+            f'Индекс похожих рецептов построен: {total} рецептов, '
+            f'за {time.monotonic() - start:.2f} с.'
+        )
+        logger.info(message)
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,77 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.images import rendition_names
+from recipes.models import Recipe
+from recipes.storage import recipe_image_storage
+
+
+def rendition_name_set(stem):
+    return {
+        name
+        for formats in rendition_names(stem).values()
+        for name in formats.values()
+    }
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for file in files:
+        yield f'{path}/{file}'
+    for directory in directories:
+        yield from walk(storage, f'{path}/{directory}')
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки и их уменьшенные копии, на которые нет ссылок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help='Не трогать файлы моложе стольких минут.',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        referenced = {
+            os.path.splitext(name)[0]
+            for name in Recipe.objects.values_list('image', flat=True)
+        }
+        cutoff = timezone.now() - timedelta(minutes=options['min_age'])
+        removed = 0
+        for storage, path in (
+            (recipe_image_storage, recipe_image_storage.prefix),
+            (default_storage, 'renditions'),
+        ):
+            if not storage.exists(path):
+                continue
+            for name in walk(storage, path):
+                stem = os.path.splitext(name)[0]
+                current = True
+                if path == 'renditions':
+                    stem = stem[len('renditions/'):].rsplit('_', 1)[0]
+                    current = name in rendition_name_set(stem)
+                if current and stem in referenced:
+                    continue
+                if storage.get_modified_time(name) > cutoff:
+                    continue
+                if current and self.is_referenced(stem):
+                    continue
+                self.stdout.write(f'Удаляется {name}')
+                if not options['dry_run']:
+                    storage.delete(name)
+                removed += 1
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {removed}.'))
+
+    @staticmethod
+    def is_referenced(stem):
+        return Recipe.objects.filter(
+            Q(image=stem) | Q(image__startswith=f'{stem}.')
+        ).exists()
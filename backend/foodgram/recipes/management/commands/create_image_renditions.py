@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import create_renditions, needs_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт уменьшенные копии картинок рецептов, которых ещё нет. '
+        'Запускается по расписанию: при сохранении рецепта копии не создаются.'
+    )
+
+    def handle(self, *args, **options):
+        created = 0
+        recipes = Recipe.objects.exclude(image='').only('id', 'image')
+        for recipe in recipes.iterator():
+            image = recipe.image
+            if not image.storage.exists(image.name):
+                continue
+            if needs_renditions(image):
+                create_renditions(image)
+                created += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Уменьшенные копии созданы для {created} рецептов.'
+        ))
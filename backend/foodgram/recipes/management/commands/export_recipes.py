@@ -0,0 +1,34 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.transfer import export_rows, open_stream, recipe_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с авторами, тегами и ингредиентами '
+            'в JSON Lines (путь, *.gz или "-" для stdout).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть > 0.')
+        start = time.monotonic()
+        exported = 0
+        with open_stream(options['path'], 'w') as file:
+            for recipes in recipe_chunks(options['chunk_size']):
+                for row in export_rows(recipes):
+                    file.write(row + '\n')
+                exported += len(recipes)
+        message = (
+            f'Выгружено рецептов: {exported} в {options["path"]}, '
+            f'за {time.monotonic() - start:.2f} с.'
+        )
+        logger.info(message)
+        self.stderr.write(self.style.SUCCESS(message))
@@ -0,0 +1,113 @@
+import logging
+import multiprocessing
+import threading
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from recipes.autocomplete import ingredient_index
+from recipes.cache import RECIPES_VERSION_KEY, TAGS_VERSION_KEY, bump_version
+from recipes.counters import count_of
+from recipes.models import Recipe
+from recipes.transfer import RecipeImporter, open_stream
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+importer = None
+
+
+def import_batch(start, lines):
+    global importer
+    if importer is None:
+        importer = RecipeImporter()
+    return importer.import_batch(start, lines)
+
+
+def batches(file, batch_size):
+    start = 1
+    while True:
+        lines = list(islice(file, batch_size))
+        if not lines:
+            return
+        yield start, lines
+        start += len(lines)
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из JSON Lines, созданного export_recipes '
+            '(путь, *.gz или "-" для stdin). Рецепты, которые уже есть '
+            'у того же автора с тем же названием, пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Число процессов для параллельной загрузки.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size и --workers должны быть > 0.')
+        start = time.monotonic()
+        with open_stream(options['path'], 'r') as file:
+            try:
+                if options['workers'] == 1:
+                    totals = [
+                        import_batch(*batch)
+                        for batch in batches(file, options['batch_size'])
+                    ]
+                else:
+                    totals = self.import_parallel(
+                        batches(file, options['batch_size']),
+                        options['workers'],
+                    )
+            except (KeyError, ValueError) as error:
+                raise CommandError(f'Ошибка в данных: {error}')
+        imported = sum(total for total, _ in totals)
+        skipped = sum(skipped for _, skipped in totals)
+        User.objects.update(recipes_count=count_of(Recipe, 'author'))
+        for key in (RECIPES_VERSION_KEY, TAGS_VERSION_KEY):
+            transaction.on_commit(lambda key=key: bump_version(key))
+        transaction.on_commit(ingredient_index.invalidate)
+        message = (
+            f'Загружено рецептов: {imported}, пропущено строк: {skipped}, '
+            f'за {time.monotonic() - start:.2f} с. Картинки переносятся '
+            'отдельно, затем запустите create_image_renditions.'
+        )
+        logger.info(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    @staticmethod
+    def import_parallel(batches, workers):
+        totals = []
+        errors = []
+        slots = threading.BoundedSemaphore(workers * 2)
+
+        def done(result):
+            totals.append(result)
+            slots.release()
+
+        def failed(error):
+            errors.append(error)
+            slots.release()
+
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for batch in batches:
+                slots.acquire()
+                if errors:
+                    break
+                pool.apply_async(
+                    import_batch, batch, callback=done, error_callback=failed
+                )
+            pool.close()
+            pool.join()
+        if errors:
+            raise errors[0]
+        return totals
@@ -1,25 +1,134 @@
 import csv
+import json
 import logging
+import os
+import sys
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.autocomplete import ingredient_index
 from recipes.models import Ingredient
 
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'json')
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    buffer = ''
+
+    def fill(buffer):
+        buffer = buffer.lstrip()
+        while not buffer:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise ValueError('Неожиданный конец JSON.')
+            buffer = chunk.lstrip()
+        return buffer
+
+    buffer = fill(buffer)
+    if buffer[0] != '[':
+        raise ValueError('Ожидается JSON-массив.')
+    buffer = fill(buffer[1:])
+    if buffer[0] == ']':
+        return
+    while True:
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer)
+                break
+            except json.JSONDecodeError:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer += chunk
+        yield value
+        buffer = fill(buffer[end:])
+        if buffer[0] == ']':
+            return
+        if buffer[0] != ',':
+            raise ValueError('Ожидается "," между элементами JSON-массива.')
+        buffer = fill(buffer[1:])
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON (путь или "-" для stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+        )
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--batch-size', type=int, default=1000)
 
     def handle(self, *args, **options):
-        logging.basicConfig(filename='import.log', level=logging.INFO)
-        self.import_ingredients()
-        logging.info('База загружена.')
-
-    def import_ingredients(self, file='ingredients.csv'):
-        logging.info(f'Данные загружены из {file}')
-        path = f'./data/{file}'
-        with open(path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                status, created = Ingredient.objects.update_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
+        path = options['path']
+        file_format = options['format'] or self.guess_format(path)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть > 0.')
+        start = time.monotonic()
+        try:
+            if path == '-':
+                total, inserted = self.import_ingredients(
+                    sys.stdin, file_format, options['batch_size']
                 )
+            else:
+                with open(path, newline='', encoding='utf-8') as file:
+                    total, inserted = self.import_ingredients(
+                        file, file_format, options['batch_size']
+                    )
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Ошибка в данных: {error}')
+        message = (
+            f'Данные загружены из {path}: добавлено {inserted}, '
+            f'пропущено {total - inserted}, '
+            f'за {time.monotonic() - start:.2f} с.'
+        )
+        logger.info(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    @staticmethod
+    def guess_format(path):
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if extension in FORMATS:
+            return extension
+        if path == '-':
+            return 'csv'
+        raise CommandError(f'Не удалось определить формат {path}, '
+                           'укажите --format.')
+
+    @staticmethod
+    def read_rows(file, file_format):
+        if file_format == 'json':
+            for row in iter_json_array(file):
+                yield row['name'], row['measurement_unit']
+            return
+        for row in csv.reader(file):
+            if row:
+                yield row[0], row[1]
+
+    def import_ingredients(self, file, file_format, batch_size):
+        rows = self.read_rows(file, file_format)
+        total = 0
+        with transaction.atomic():
+            before = Ingredient.objects.count()
+            while True:
+                batch = [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+            inserted = Ingredient.objects.count() - before
+            transaction.on_commit(ingredient_index.invalidate)
+        return total, inserted
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import CartTotal
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги корзин и сверяет их с корзинами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить итоги, не пересчитывая.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            CartTotal.objects.refresh()
+            self.stdout.write('Итоги корзин пересчитаны.')
+        mismatches = self.verify()
+        if mismatches:
+            for user, ingredient, stored, live in mismatches[:20]:
+                self.stderr.write(
+                    f'user={user} ingredient={ingredient}: '
+                    f'в таблице {stored}, в корзинах {live}'
+                )
+            raise CommandError(f'Расхождений: {len(mismatches)}.')
+        self.stdout.write(self.style.SUCCESS('Итоги корзин сходятся.'))
+
+    @staticmethod
+    def verify():
+        live = {
+            (row['recipe__cart__user'], row['ingredient']): row['total']
+            for row in CartTotal.objects.aggregate_carts().iterator()
+        }
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount in CartTotal.objects.values_list(
+                'user', 'ingredient', 'amount'
+            ).iterator()
+        }
+        return sorted(
+            (*key, stored.get(key), live.get(key))
+            for key in live.keys() | stored.keys()
+            if stored.get(key) != live.get(key)
+        )
@@ -0,0 +1,33 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import find_drift, reconcile_counters
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Subscribe, User
+
+logger = logging.getLogger(__name__)
+
+MODELS = (Recipe, User, Favorite, Cart, Subscribe)
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и пересчитывает счётчики избранного, корзин и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = find_drift(*MODELS)
+            for counter, rows in drift.items():
+                self.stdout.write(f'{counter}: расхождений {rows}')
+            if not options['check']:
+                reconcile_counters(*MODELS)
+                logger.info(f'Счётчики пересчитаны: {drift}')
+                self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
@@ -0,0 +1,248 @@
+import logging
+import random
+from hashlib import md5
+from io import BytesIO
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.cache import RECIPES_VERSION_KEY, TAGS_VERSION_KEY, bump_version
+from recipes.counters import reconcile_counters
+from recipes.images import create_renditions, needs_renditions
+from recipes.models import (Cart, CartTotal, Favorite, Ingredient,
+                            IngridientForRecipe, Recipe, Tag)
+from recipes.storage import recipe_image_storage
+from users.models import Subscribe, User
+
+logger = logging.getLogger(__name__)
+
+
+def unique_pairs(rng, left, right, count, distinct=False):
+    limit = len(left) * len(right) - (len(set(left) & set(right))
+                                      if distinct else 0)
+    pairs = set()
+    while len(pairs) < min(count, limit):
+        pair = rng.choice(left), rng.choice(right)
+        if not (distinct and pair[0] == pair[1]):
+            pairs.add(pair)
+    return sorted(pairs)
+
+
+def tag_color(slug):
+    return '#' + md5(slug.encode()).hexdigest()[:6]
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу воспроизводимыми синтетическими данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=1000)
+        parser.add_argument('--subscriptions', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help=(
+                'Удалить ранее созданные данные с тем же префиксом. '
+                'Пользователи с другим паролем не удаляются.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['users'] < 1 or options['tags'] < 1:
+            raise CommandError('--users и --tags должны быть > 0.')
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        with transaction.atomic():
+            if options['clear']:
+                self.seeded_users(prefix).delete()
+                self.seeded_tags(prefix).delete()
+            elif self.seeded_users(prefix).exists():
+                raise CommandError(
+                    f'Данные с префиксом {prefix} уже есть, '
+                    'укажите --clear или другой --prefix.'
+                )
+            self.seed(random.Random(options['seed']), prefix, options)
+            transaction.on_commit(lambda: bump_version(RECIPES_VERSION_KEY))
+            transaction.on_commit(lambda: bump_version(TAGS_VERSION_KEY))
+        message = (
+            f'Синтетические данные {prefix} (seed={options["seed"]}) '
+            f'созданы: пользователей {options["users"]}, '
+            f'рецептов {options["recipes"]}.'
+        )
+        logger.info(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def seed(self, rng, prefix, options):
+        batch_size = options['batch_size']
+        tags = self.create_tags(prefix, options['tags'])
+        users = self.create_users(prefix, options['users'], batch_size)
+        image = self.create_image()
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', 'name')
+        )
+        Recipe.objects.bulk_create(
+            (
+                self.make_recipe(rng, users, ingredients, image, number)
+                for number in range(options['recipes'])
+            ),
+            batch_size=batch_size,
+        )
+        recipes = list(
+            Recipe.objects.filter(author__in=users).order_by(
+                'id'
+            ).values_list('id', flat=True)
+        )
+        IngridientForRecipe.objects.bulk_create(
+            (
+                IngridientForRecipe(
+                    recipe_id=recipe, ingredient_id=ingredient,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient, _ in rng.sample(
+                    ingredients,
+                    min(options['ingredients_per_recipe'], len(ingredients)),
+                )
+            ),
+            batch_size=batch_size,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in rng.sample(
+                    tags, min(options['tags_per_recipe'], len(tags))
+                )
+            ),
+            batch_size=batch_size,
+        )
+        for model, count in ((Favorite, options['favorites']),
+                             (Cart, options['carts'])):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user, recipe_id=recipe)
+                    for user, recipe in unique_pairs(
+                        rng, users, recipes, count
+                    )
+                ),
+                batch_size=batch_size,
+            )
+        Subscribe.objects.bulk_create(
+            (
+                Subscribe(user_id=user, author_id=author)
+                for user, author in unique_pairs(
+                    rng, users, users, options['subscriptions'],
+                    distinct=True,
+                )
+            ),
+            batch_size=batch_size,
+        )
+        reconcile_counters(Recipe, User, Favorite, Cart, Subscribe)
+        CartTotal.objects.refresh(users=users)
+
+    @staticmethod
+    def create_tags(prefix, count):
+        slugs = [f'{prefix}-{number}' for number in range(count)]
+        Tag.objects.bulk_create(
+            [
+                Tag(
+                    name=slug,
+                    slug=slug,
+                    color=tag_color(slug),
+                )
+                for slug in slugs
+            ],
+            ignore_conflicts=True,
+        )
+        return list(
+            Tag.objects.filter(slug__in=slugs).order_by(
+                'id'
+            ).values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def create_users(prefix, count, batch_size):
+        password = make_password(f'{prefix}-password')
+        User.objects.bulk_create(
+            (
+                User(
+                    email=f'{prefix}_{number}@example.com',
+                    username=f'{prefix}_{number}',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        return list(
+            User.objects.filter(password=password).order_by(
+                'id'
+            ).values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def seeded_users(prefix):
+        # Only accounts with the seeded password are ours; a real user whose
+        # name happens to start with the prefix is left alone.
+        users = User.objects.filter(username__startswith=f'{prefix}_')
+        hashes = [
+            password
+            for password in users.values_list(
+                'password', flat=True
+            ).order_by().distinct()
+            if check_password(f'{prefix}-password', password)
+        ]
+        return users.filter(password__in=hashes)
+
+    @staticmethod
+    def seeded_tags(prefix):
+        return Tag.objects.filter(pk__in=[
+            pk
+            for pk, slug, color in Tag.objects.filter(
+                slug__startswith=f'{prefix}-'
+            ).values_list('pk', 'slug', 'color')
+            if color == tag_color(slug)
+        ])
+
+    @staticmethod
+    def create_image():
+        buffer = BytesIO()
+        Image.new('RGB', (960, 640), '#d08040').save(buffer, 'JPEG')
+        name = recipe_image_storage.save(
+            'seed.jpg', ContentFile(buffer.getvalue())
+        )
+        image = Recipe(image=name).image
+        if needs_renditions(image):
+            create_renditions(image)
+        return name
+
+    @staticmethod
+    def make_recipe(rng, users, ingredients, image, number):
+        _, name = rng.choice(ingredients)
+        return Recipe(
+            author_id=rng.choice(users),
+            name=f'{name.capitalize()} №{number}',
+            text=' '.join(
+                ingredient
+                for _, ingredient in rng.sample(ingredients,
+                                                min(5, len(ingredients)))
+            ),
+            cooking_time=rng.randint(1, 180),
+            image=image,
+        )
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm;',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops);',
+)
+DROP_SQL = ('DROP INDEX IF EXISTS recipes_ingredient_name_trgm;',)
+
+
+def run_on_postgresql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_auto_20230913_1050'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SQL),
+            run_on_postgresql(DROP_SQL),
+        ),
+    ]
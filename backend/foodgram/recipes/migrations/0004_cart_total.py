@@ -0,0 +1,54 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_cart_totals(apps, schema_editor):
+    CartTotal = apps.get_model('recipes', 'CartTotal')
+    IngridientForRecipe = apps.get_model('recipes', 'IngridientForRecipe')
+    CartTotal.objects.bulk_create(
+        (
+            CartTotal(
+                user_id=row['recipe__cart__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total'],
+            )
+            for row in IngridientForRecipe.objects.filter(
+                recipe__cart__isnull=False
+            ).values('recipe__cart__user', 'ingredient').annotate(
+                total=models.Sum('amount')
+            ).order_by().iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог корзины',
+                'verbose_name_plural': 'Итоги корзин',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='carttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_total'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
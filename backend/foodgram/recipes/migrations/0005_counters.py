@@ -0,0 +1,61 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_counters(recipe_model, user_model, favorite_model, cart_model,
+                       subscribe_model):
+    recipe_model.objects.update(
+        favorites_count=count_of(favorite_model, 'recipe'),
+        carts_count=count_of(cart_model, 'recipe'),
+    )
+    user_model.objects.update(
+        recipes_count=count_of(recipe_model, 'author'),
+        subscribers_count=count_of(subscribe_model, 'author'),
+    )
+
+
+def fill_counters(apps, schema_editor):
+    reconcile_counters(
+        apps.get_model('recipes', 'Recipe'),
+        apps.get_model('users', 'User'),
+        apps.get_model('recipes', 'Favorite'),
+        apps.get_model('recipes', 'Cart'),
+        apps.get_model('users', 'Subscribe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_cart_total'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='', verbose_name='Картинка, закодированная в Base64'),
+        ),
+    ]
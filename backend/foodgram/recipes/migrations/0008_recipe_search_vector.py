@@ -0,0 +1,94 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:18
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_CREATE_SQL = (
+    '''
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    ''',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_update '
+    'ON recipes_recipe;',
+    'CREATE TRIGGER recipes_recipe_search_vector_update '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();',
+    'UPDATE recipes_recipe SET name = name;',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector);',
+)
+POSTGRESQL_DROP_SQL = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_update '
+    'ON recipes_recipe;',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update();',
+)
+SQLITE_CREATE_SQL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5('
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2');",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert '
+    'AFTER INSERT ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_fts(rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END;',
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete '
+    'AFTER DELETE ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END;",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); "
+    'INSERT INTO recipes_recipe_fts(rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END;',
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild');",
+)
+SQLITE_DROP_SQL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert;',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete;',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update;',
+    'DROP TABLE IF EXISTS recipes_recipe_fts;',
+)
+CREATE_SQL = {
+    'postgresql': POSTGRESQL_CREATE_SQL,
+    'sqlite': SQLITE_CREATE_SQL,
+}
+DROP_SQL = {
+    'postgresql': POSTGRESQL_DROP_SQL,
+    'sqlite': SQLITE_DROP_SQL,
+}
+
+
+def run_for_vendor(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_for_vendor(CREATE_SQL),
+            run_for_vendor(DROP_SQL),
+        ),
+    ]
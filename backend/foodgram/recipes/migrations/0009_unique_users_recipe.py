@@ -0,0 +1,85 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:26
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_counters(recipe_model, user_model, favorite_model, cart_model,
+                       subscribe_model):
+    recipe_model.objects.update(
+        favorites_count=count_of(favorite_model, 'recipe'),
+        carts_count=count_of(cart_model, 'recipe'),
+    )
+    user_model.objects.update(
+        recipes_count=count_of(recipe_model, 'author'),
+        subscribers_count=count_of(subscribe_model, 'author'),
+    )
+
+
+def remove_duplicates(apps, schema_editor):
+    removed = 0
+    for name in ('Favorite', 'Cart'):
+        model = apps.get_model('recipes', name)
+        keep = model.objects.values('user', 'recipe').annotate(
+            keep=models.Min('id')
+        ).values('keep')
+        removed += model.objects.exclude(id__in=keep).delete()[0]
+    if not removed:
+        return
+    reconcile_counters(
+        apps.get_model('recipes', 'Recipe'),
+        apps.get_model('users', 'User'),
+        apps.get_model('recipes', 'Favorite'),
+        apps.get_model('recipes', 'Cart'),
+        apps.get_model('users', 'Subscribe'),
+    )
+    CartTotal = apps.get_model('recipes', 'CartTotal')
+    IngridientForRecipe = apps.get_model('recipes', 'IngridientForRecipe')
+    CartTotal.objects.all().delete()
+    CartTotal.objects.bulk_create(
+        (
+            CartTotal(
+                user_id=row['recipe__cart__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total'],
+            )
+            for row in IngridientForRecipe.objects.filter(
+                recipe__cart__isnull=False
+            ).values('recipe__cart__user', 'ingredient').annotate(
+                total=models.Sum('amount')
+            ).order_by().iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_cart_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite_user_recipe'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_name_trgm_yo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveIntegerField(verbose_name='Рецепт')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Удалённый рецепт',
+                'verbose_name_plural': 'Удалённые рецепты',
+            },
+        ),
+    ]
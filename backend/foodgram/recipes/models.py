@@ -1,9 +1,23 @@
+from datetime import timedelta
+
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 
+from recipes.search import search_recipes
+from recipes.storage import recipe_image_storage
 from users.models import User
 
+users_recipes_changed = Signal()
+
+# Indexes synced from updated_at look back this far, so rows written by
+# transactions that committed after the previous sync are not missed.
+CHANGES_OVERLAP = timedelta(minutes=5)
+DELETED_RECIPES_RETENTION = timedelta(days=1)
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -59,6 +73,50 @@ class Ingredient(models.Model):
         return f'{self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags', 'ingredient_for_recipe__ingredient'
+        ).defer('search_vector')
+
+    def search(self, value):
+        return search_recipes(self, value)
+
+    def previews(self):
+        return self.only('id', 'author', 'name', 'image', 'cooking_time')
+
+    def latest_per_author(self, limit):
+        return self.filter(pk__in=models.Subquery(
+            Recipe.objects.filter(
+                author=models.OuterRef('author')
+            ).values('pk')[:limit]
+        ))
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            in_shopping_cart=models.Exists(
+                Cart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+        )
+
+
 class Recipe(models.Model):
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -71,7 +129,10 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Список id тегов'
     )
-    image = models.ImageField('Картинка, закодированная в Base64')
+    image = models.ImageField(
+        'Картинка, закодированная в Base64',
+        storage=recipe_image_storage,
+    )
     name = models.CharField(
         max_length=200,
         verbose_name='Название'
@@ -92,6 +153,24 @@ class Recipe(models.Model):
     )
     is_favorited = models.BooleanField(default=False)
     is_in_shopping_cart = models.BooleanField(default=False)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах',
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата изменения',
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -131,6 +210,50 @@ class IngridientForRecipe(models.Model):
         return f'{self.amount} {self.ingredient}'
 
 
+class UsersRecipeQuerySet(models.QuerySet):
+
+    def execute(self, sql, params):
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(
+                table=connection.ops.quote_name(self.model._meta.db_table),
+                recipes=connection.ops.quote_name(Recipe._meta.db_table),
+                ids=', '.join(['%s'] * (len(params) - 1)),
+            ), params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_many(self, user, recipe_ids):
+        added = self.execute(
+            'INSERT INTO {table} (user_id, recipe_id) '
+            'SELECT %s, id FROM {recipes} WHERE id IN ({ids}) '
+            'ON CONFLICT DO NOTHING RETURNING recipe_id',
+            [user.pk, *recipe_ids],
+        )
+        if added:
+            users_recipes_changed.send(
+                sender=self.model, user=user, recipe_ids=added, added=True
+            )
+        return added
+
+    def remove_many(self, user, recipe_ids):
+        removed = self.execute(
+            'DELETE FROM {table} WHERE user_id = %s AND recipe_id IN ({ids}) '
+            'RETURNING recipe_id',
+            [user.pk, *recipe_ids],
+        )
+        if removed:
+            users_recipes_changed.send(
+                sender=self.model, user=user, recipe_ids=removed, added=False
+            )
+        return removed
+
+    def add(self, user, recipe_id):
+        return bool(self.add_many(user, [recipe_id]))
+
+    def remove(self, user, recipe_id):
+        return bool(self.remove_many(user, [recipe_id]))
+
+
 class AbstractUsersRecipe(models.Model):
     user = models.ForeignKey(
         User,
@@ -143,8 +266,16 @@ class AbstractUsersRecipe(models.Model):
         verbose_name='Рецепт',
     )
 
+    objects = UsersRecipeQuerySet.as_manager()
+
     class Meta:
         abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_%(class)s_user_recipe',
+            ),
+        ]
 
     def str__(self):
         return f'{self.user}{self.recipe}'
@@ -160,3 +291,125 @@ class Cart(AbstractUsersRecipe):
     class Meta(AbstractUsersRecipe.Meta):
         default_related_name = 'cart'
         verbose_name = 'Корзина'
+
+
+class CartTotalQuerySet(models.QuerySet):
+
+    def aggregate_carts(self, users=None, ingredients=None):
+        lookups = {'recipe__cart__isnull': False}
+        if users is not None:
+            lookups['recipe__cart__user__in'] = users
+        if ingredients is not None:
+            lookups['ingredient__in'] = ingredients
+        return IngridientForRecipe.objects.filter(**lookups).values(
+            'recipe__cart__user', 'ingredient'
+        ).annotate(total=models.Sum('amount')).order_by()
+
+    def refresh_on_commit(self, users, ingredients=None):
+        users = list(users)
+        if ingredients is not None:
+            ingredients = list(ingredients)
+        if users and ingredients != []:
+            transaction.on_commit(
+                lambda: CartTotal.objects.refresh(users, ingredients)
+            )
+
+    def refresh_recipe_on_commit(self, recipe, ingredients=None):
+        if ingredients is not None and not ingredients:
+            return
+        self.refresh_on_commit(
+            Cart.objects.filter(recipe=recipe).values_list('user', flat=True),
+            ingredients,
+        )
+
+    def refresh(self, users=None, ingredients=None):
+        sql, params = self.aggregate_carts(users, ingredients).order_by(
+            'recipe__cart__user', 'ingredient'
+        ).query.sql_with_params()
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            # An upsert lets overlapping refreshes of the same carts run
+            # side by side without colliding on unique_cart_total.
+            cursor.execute(
+                'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                'SELECT * FROM ({totals}) AS totals WHERE true '
+                'ON CONFLICT (user_id, ingredient_id) '
+                'DO UPDATE SET amount = EXCLUDED.amount'.format(
+                    table=connection.ops.quote_name(self.model._meta.db_table),
+                    totals=sql,
+                ),
+                params,
+            )
+            stale = self.all()
+            if users is not None:
+                stale = stale.filter(user__in=users)
+            if ingredients is not None:
+                stale = stale.filter(ingredient__in=ingredients)
+            stale.exclude(models.Exists(IngridientForRecipe.objects.filter(
+                ingredient=models.OuterRef('ingredient'),
+                recipe__cart__user=models.OuterRef('user'),
+            ))).delete()
+
+
+class CartTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = CartTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог корзины'
+        verbose_name_plural = 'Итоги корзин'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_total',
+            )]
+
+    def __str__(self):
+        return f'{self.user}: {self.amount} {self.ingredient}'
+
+
+class DeletedRecipeQuerySet(models.QuerySet):
+
+    def covers(self, moment):
+        return moment > timezone.now() - DELETED_RECIPES_RETENTION
+
+    def since(self, moment):
+        return self.filter(deleted_at__gt=moment).values_list(
+            'recipe_id', flat=True
+        )
+
+    def prune(self):
+        return self.filter(
+            deleted_at__lt=timezone.now() - DELETED_RECIPES_RETENTION
+        ).delete()
+
+
+class DeletedRecipe(models.Model):
+    recipe_id = models.PositiveIntegerField(verbose_name='Рецепт')
+    deleted_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата удаления',
+    )
+
+    objects = DeletedRecipeQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id}'
@@ -0,0 +1,235 @@
+import threading
+from array import array
+
+import numpy as np
+from django.utils import timezone
+
+from recipes.models import (CHANGES_OVERLAP, DeletedRecipe,
+                            IngridientForRecipe, Recipe)
+
+NO_POSITIONS = np.zeros(0, dtype=np.int32)
+
+
+def to_bits(positions, words):
+    flags = np.zeros(words * 64, dtype=bool)
+    flags[positions] = True
+    return np.packbits(flags, bitorder='little').view(np.uint64)
+
+
+def bit_positions(bits):
+    return np.flatnonzero(
+        np.unpackbits(bits.view(np.uint8), bitorder='little')
+    )
+
+
+def resize(bits, words):
+    return np.concatenate(
+        [bits[:words], np.zeros(max(words - len(bits), 0), dtype=np.uint64)]
+    )
+
+
+def add_planes(planes, bits):
+    for position, plane in enumerate(planes):
+        planes[position], bits = plane ^ bits, plane & bits
+        if not bits.any():
+            return
+    planes.append(bits)
+
+
+def subtract_planes(minuend, subtrahend, mask):
+    difference = []
+    borrow = 0
+    for position in range(max(len(minuend), len(subtrahend))):
+        left = minuend[position] if position < len(minuend) else 0
+        right = subtrahend[position] if position < len(subtrahend) else 0
+        difference.append((left ^ right ^ borrow) & mask)
+        borrow = ((left ^ mask) & (right | borrow)) | (left & right & borrow)
+    return difference
+
+
+def equal_planes(planes, value, mask):
+    result = mask
+    for position, plane in enumerate(planes):
+        result = result & (plane if value >> position & 1 else plane ^ mask)
+    return result if value >> len(planes) == 0 else np.zeros_like(mask)
+
+
+class PantryIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._updated = {}
+        self.clear()
+
+    def clear(self):
+        # Recipes are stored under dense positions rather than their ids;
+        # ingredients map to position arrays and become bitsets per query.
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.ingredients = {}
+        self.totals = []
+        self.removed = 0
+        self._order = None
+
+    @property
+    def words(self):
+        return -(-len(self.recipe_ids) // 64)
+
+    def find(self, recipe_ids):
+        if self._order is None:
+            self._order = np.argsort(self.recipe_ids, kind='stable')
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        if not len(self._order):
+            return NO_POSITIONS
+        found = self._order[np.minimum(
+            np.searchsorted(self.recipe_ids, recipe_ids, sorter=self._order),
+            len(self._order) - 1,
+        )]
+        return found[self.recipe_ids[found] == recipe_ids]
+
+    def reset(self):
+        with self._lock:
+            self._synced_at = None
+
+    def load(self, recipe_ids=None):
+        rows = IngridientForRecipe.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        if recipe_ids is not None:
+            rows = rows.filter(recipe__in=recipe_ids)
+        pairs = array('q')
+        for row in rows.iterator(chunk_size=10000):
+            pairs.extend(row)
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    def append(self, pairs):
+        if not len(pairs):
+            return
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        pairs = pairs[np.concatenate(
+            [[True], (pairs[1:] != pairs[:-1]).any(axis=1)]
+        )]
+        recipe_ids, rows, counts = np.unique(
+            pairs[:, 0], return_inverse=True, return_counts=True
+        )
+        start = len(self.recipe_ids)
+        self.recipe_ids = np.concatenate([self.recipe_ids, recipe_ids])
+        self._order = None
+        positions = (start + rows).astype(np.int32)
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredient_ids, starts = np.unique(
+            pairs[order, 1], return_index=True
+        )
+        for ingredient_id, added in zip(
+            ingredient_ids.tolist(), np.split(positions[order], starts[1:])
+        ):
+            self.ingredients[ingredient_id] = np.concatenate(
+                [self.ingredients.get(ingredient_id, NO_POSITIONS), added]
+            )
+        words = self.words
+        totals = [resize(plane, words) for plane in self.totals]
+        added = np.arange(start, len(self.recipe_ids))
+        for position in range(int(counts.max()).bit_length()):
+            if position == len(totals):
+                totals.append(np.zeros(words, dtype=np.uint64))
+            totals[position] |= to_bits(
+                added[counts >> position & 1 == 1], words
+            )
+        self.totals = totals
+
+    def rebuild(self):
+        self.clear()
+        self.append(self.load())
+
+    def apply(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        old = self.find(recipe_ids)
+        self.removed += len(old)
+        if self.removed > len(self.recipe_ids) - self.removed:
+            self.rebuild()
+            return
+        # Changed recipes get new positions; postings of the old ones stay
+        # behind but drop out of every query once their totals are cleared.
+        keep = ~to_bits(old, self.words)
+        self.totals = [plane & keep for plane in self.totals]
+        self.recipe_ids = self.recipe_ids.copy()
+        self.recipe_ids[old] = -1
+        self._order = None
+        self.append(self.load(recipe_ids))
+
+    def sync(self):
+        started_at = timezone.now()
+        with self._lock:
+            since = self._synced_at and self._synced_at - CHANGES_OVERLAP
+            if since is None or not DeletedRecipe.objects.covers(since):
+                since = started_at - CHANGES_OVERLAP
+                updated = self.updated_since(since)
+                self.rebuild()
+            else:
+                # The overlap returns recipes seen by the previous sync too;
+                # only those with a newer updated_at are reloaded.
+                updated = self.updated_since(since)
+                recipe_ids = {
+                    pk for pk, updated_at in updated.items()
+                    if self._updated.get(pk) != updated_at
+                }
+                deleted = np.fromiter(
+                    DeletedRecipe.objects.since(since), dtype=np.int64
+                )
+                recipe_ids.update(
+                    self.recipe_ids[self.find(deleted)].tolist()
+                )
+                if recipe_ids:
+                    self.apply(recipe_ids)
+            self._updated = updated
+            self._synced_at = started_at
+
+    @staticmethod
+    def updated_since(moment):
+        return dict(Recipe.objects.filter(
+            updated_at__gt=moment
+        ).order_by().values_list('pk', 'updated_at'))
+
+    def coverage(self, ingredient_ids, max_missing):
+        self.sync()
+        with self._lock:
+            words = self.words
+            present = np.zeros(words, dtype=np.uint64)
+            for plane in self.totals:
+                present |= plane
+            matched = []
+            candidates = np.zeros(words, dtype=np.uint64)
+            for ingredient_id in set(ingredient_ids):
+                bits = present & to_bits(
+                    self.ingredients.get(ingredient_id, NO_POSITIONS), words
+                )
+                candidates |= bits
+                add_planes(matched, bits)
+            missing = subtract_planes(self.totals, matched, candidates)
+            return [
+                (count, np.sort(self.recipe_ids[bit_positions(
+                    equal_planes(missing, count, candidates)
+                )])[::-1])
+                for count in range(max_missing + 1)
+            ]
+
+    def search(self, ingredient_ids, max_missing, limit, allowed=None):
+        found = []
+        for count, tier in self.coverage(ingredient_ids, max_missing):
+            start, size = 0, limit
+            # allowed() filters a bounded slice of a tier at a time; slices
+            # double so a selective filter still needs few round trips.
+            while start < len(tier) and len(found) < limit:
+                recipe_ids = tier[start:start + size].tolist()
+                if allowed is not None:
+                    kept = allowed(recipe_ids)
+                    recipe_ids = [pk for pk in recipe_ids if pk in kept]
+                found.extend(
+                    (recipe_id, count)
+                    for recipe_id in recipe_ids[:limit - len(found)]
+                )
+                start += size
+                size *= 2
+        return found
+
+
+pantry_index = PantryIndex()
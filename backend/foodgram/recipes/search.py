@@ -0,0 +1,35 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+
+
+def fts5_query(value):
+    return ' '.join(
+        '"%s"' % token.replace('"', '""') for token in value.split()
+    )
+
+
+def search_recipes(queryset, value):
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+    if connection.vendor == 'sqlite':
+        query = fts5_query(value)
+        if not query:
+            return queryset.none()
+        return queryset.annotate(
+            rank=RawSQL(
+                'SELECT bm25(recipes_recipe_fts) FROM recipes_recipe_fts '
+                'WHERE recipes_recipe_fts MATCH %s '
+                'AND recipes_recipe_fts.rowid = recipes_recipe.id',
+                (query,),
+            )
+        ).filter(rank__isnull=False).order_by('rank', '-id')
+    return queryset.filter(name__icontains=value)
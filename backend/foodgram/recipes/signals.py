@@ -0,0 +1,184 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.autocomplete import ingredient_index
+from recipes.cache import (RECIPES_DELETED_KEY, RECIPES_VERSION_KEY,
+                           TAGS_VERSION_KEY, bump_version, recipe_version_key,
+                           touch_timestamp, user_flags_key)
+from recipes.counters import change_counter, change_counters
+from recipes.models import (Cart, CartTotal, DeletedRecipe, Favorite,
+                            Ingredient, IngridientForRecipe, Recipe, Tag,
+                            users_recipes_changed)
+from users.models import User
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'carts_count',
+}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(pre_delete, sender=Cart)
+def update_cart_totals(instance, **kwargs):
+    CartTotal.objects.refresh_on_commit(
+        [instance.user_id],
+        IngridientForRecipe.objects.filter(
+            recipe=instance.recipe_id
+        ).values_list('ingredient', flat=True),
+    )
+
+
+@receiver(post_save, sender=IngridientForRecipe)
+@receiver(pre_delete, sender=IngridientForRecipe)
+def update_recipe_cart_totals(instance, created=True, **kwargs):
+    CartTotal.objects.refresh_recipe_on_commit(
+        instance.recipe_id,
+        [instance.ingredient_id] if created else None,
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe, instance.recipe_id, RECIPE_COUNTERS[sender], 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, RECIPE_COUNTERS[sender], -1)
+
+
+@receiver(users_recipes_changed, sender=Favorite)
+@receiver(users_recipes_changed, sender=Cart)
+def change_recipe_counters(sender, recipe_ids, added, **kwargs):
+    change_counters(
+        Recipe, recipe_ids, RECIPE_COUNTERS[sender], 1 if added else -1
+    )
+
+
+@receiver(users_recipes_changed, sender=Cart)
+def update_bulk_cart_totals(user, recipe_ids, **kwargs):
+    CartTotal.objects.refresh_on_commit(
+        [user.pk],
+        IngridientForRecipe.objects.filter(
+            recipe__in=recipe_ids
+        ).order_by().values_list('ingredient', flat=True).distinct(),
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+def touch_user_flags(instance, **kwargs):
+    touch_timestamp(user_flags_key(instance.user_id))
+
+
+@receiver(users_recipes_changed, sender=Favorite)
+@receiver(users_recipes_changed, sender=Cart)
+def touch_bulk_user_flags(user, **kwargs):
+    touch_timestamp(user_flags_key(user.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def touch_deleted_recipes(**kwargs):
+    touch_timestamp(RECIPES_DELETED_KEY)
+
+
+@receiver(post_delete, sender=Recipe)
+def record_deleted_recipe(instance, **kwargs):
+    DeletedRecipe.objects.create(recipe_id=instance.pk)
+
+
+def touch_recipes(**lookups):
+    Recipe.objects.filter(**lookups).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=IngridientForRecipe)
+@receiver(post_delete, sender=IngridientForRecipe)
+def touch_recipe_ingredients(instance, **kwargs):
+    touch_recipes(pk=instance.recipe_id)
+
+
+def tagged_recipe_ids(instance, action, reverse, pk_set):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return []
+    if not reverse:
+        return [instance.pk]
+    if pk_set is None:
+        return list(instance.recipes.values_list('pk', flat=True))
+    return list(pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    recipe_ids = tagged_recipe_ids(instance, action, reverse, pk_set)
+    if recipe_ids:
+        touch_recipes(pk__in=recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(instance, **kwargs):
+    touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        touch_recipes(ingredients=instance)
+
+
+def invalidate_recipes(*recipe_ids):
+    bump_version(RECIPES_VERSION_KEY)
+    for recipe_id in recipe_ids:
+        bump_version(recipe_version_key(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_responses(instance, **kwargs):
+    invalidate_recipes(instance.pk)
+
+
+@receiver(post_save, sender=IngridientForRecipe)
+@receiver(post_delete, sender=IngridientForRecipe)
+def invalidate_recipe_ingredient_responses(instance, **kwargs):
+    invalidate_recipes(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tag_responses(instance, action, reverse, pk_set,
+                                    **kwargs):
+    recipe_ids = tagged_recipe_ids(instance, action, reverse, pk_set)
+    if recipe_ids:
+        invalidate_recipes(*recipe_ids)
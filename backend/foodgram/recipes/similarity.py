@@ -0,0 +1,267 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from scipy.sparse import csc_matrix, csr_matrix, vstack
+
+from recipes.models import CHANGES_OVERLAP, DeletedRecipe, Ingredient, Recipe
+
+CURRENT = 'current'
+KEEP_BUILDS = 2
+ARRAYS = {
+    'recipe_ids': 'q',
+    'row_ptr': 'q',
+    'row_cols': 'i',
+    'ingredient_ids': 'q',
+    'idf': 'f',
+    'col_ptr': 'q',
+    'col_rows': 'i',
+    'col_weights': 'f',
+}
+
+
+def load_array(path, typecode):
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=typecode)
+    return np.memmap(path, dtype=typecode, mode='r')
+
+
+def find(sorted_ids, pks):
+    pks = np.asarray(pks, dtype=sorted_ids.dtype)
+    positions = np.searchsorted(sorted_ids, pks)
+    found = positions < len(sorted_ids)
+    found[found] = sorted_ids[positions[found]] == pks[found]
+    return positions[found]
+
+
+class SimilarityIndex:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    @property
+    def root(self):
+        return self.directory or settings.SIMILARITY_INDEX_DIR
+
+    def current(self):
+        try:
+            with open(os.path.join(self.root, CURRENT)) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def get(self):
+        version = self.current()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self.build(version)
+                    self._version = version
+        return version, self._value
+
+    def build(self, version=None):
+        version = version or self.current()
+        if version is None:
+            return None
+        path = os.path.join(self.root, version)
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        meta['built_at'] = parse_datetime(meta['built_at'])
+        meta.update(
+            (name, load_array(os.path.join(path, name), typecode))
+            for name, typecode in ARRAYS.items()
+        )
+        meta['matrix'] = csc_matrix(
+            (meta['col_weights'], meta['col_rows'], meta['col_ptr']),
+            shape=(len(meta['recipe_ids']), len(meta['ingredient_ids'])),
+        )
+        return meta
+
+    def changed_rows(self, since, ingredient_ids):
+        columns = {pk: col for col, pk in enumerate(ingredient_ids.tolist())}
+        recipes = Recipe.objects.order_by('pk')
+        if since is not None:
+            recipes = recipes.filter(updated_at__gt=since)
+        recipe_ids = []
+        row_ptr = [0]
+        row_cols = []
+        for pk, rows in groupby(
+            recipes.values_list(
+                'pk', 'ingredient_for_recipe__ingredient'
+            ).iterator(chunk_size=10000),
+            key=itemgetter(0),
+        ):
+            recipe_ids.append(pk)
+            row_cols.extend(sorted({
+                columns[ingredient] for _, ingredient in rows
+                if ingredient in columns
+            }))
+            row_ptr.append(len(row_cols))
+        return np.array(recipe_ids, dtype=np.int64), csr_matrix(
+            (np.ones(len(row_cols), dtype=np.int8), row_cols, row_ptr),
+            shape=(len(recipe_ids), len(ingredient_ids)),
+        )
+
+    def kept_rows(self, old, since, changed_ids, ingredient_ids):
+        recipe_ids = np.asarray(old['recipe_ids'])
+        keep = ~np.isin(recipe_ids, np.concatenate([
+            changed_ids,
+            np.fromiter(DeletedRecipe.objects.since(since), dtype=np.int64),
+        ]))
+        old_ingredient_ids = np.asarray(old['ingredient_ids'])
+        columns = np.searchsorted(ingredient_ids, old_ingredient_ids)
+        known = columns < len(ingredient_ids)
+        known[known] = (
+            ingredient_ids[columns[known]] == old_ingredient_ids[known]
+        )
+        remap = csr_matrix(
+            (
+                np.ones(known.sum(), dtype=np.int8),
+                (np.flatnonzero(known), columns[known]),
+            ),
+            shape=(len(old_ingredient_ids), len(ingredient_ids)),
+        )
+        rows = csr_matrix(
+            (
+                np.ones(len(old['row_cols']), dtype=np.int8),
+                old['row_cols'],
+                old['row_ptr'],
+            ),
+            shape=(len(recipe_ids), len(old_ingredient_ids)),
+        )
+        return recipe_ids[keep], rows[keep] @ remap
+
+    def rebuild(self, full=False):
+        started_at = timezone.now()
+        old = None if full else self.build()
+        since = old['built_at'] - CHANGES_OVERLAP if old else None
+        if since is not None and not DeletedRecipe.objects.covers(since):
+            old = since = None
+        ingredient_ids = np.fromiter(
+            Ingredient.objects.order_by('pk').values_list(
+                'pk', flat=True
+            ).iterator(),
+            dtype=np.int64,
+        )
+        recipe_ids, rows = self.changed_rows(since, ingredient_ids)
+        if old is not None:
+            kept_ids, kept = self.kept_rows(
+                old, since, recipe_ids, ingredient_ids
+            )
+            order = np.argsort(
+                np.concatenate([kept_ids, recipe_ids]), kind='stable'
+            )
+            recipe_ids = np.concatenate([kept_ids, recipe_ids])[order]
+            rows = vstack([kept, rows], format='csr')[order]
+        self.write(started_at, len(recipe_ids), self.arrays(
+            recipe_ids, rows, ingredient_ids
+        ))
+        return len(recipe_ids)
+
+    @staticmethod
+    def arrays(recipe_ids, rows, ingredient_ids):
+        rows = csr_matrix(rows)
+        rows.sort_indices()
+        total = len(recipe_ids)
+        row_cols = rows.indices
+        df = np.bincount(row_cols, minlength=len(ingredient_ids))
+        idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+        weights = idf[row_cols].astype(np.float64)
+        row_of = np.repeat(np.arange(total), np.diff(rows.indptr))
+        norms = np.sqrt(np.bincount(row_of, weights ** 2, minlength=total))
+        norms[norms == 0] = 1
+        columns = csr_matrix(
+            (weights / norms[row_of], row_cols, rows.indptr),
+            shape=rows.shape,
+        ).tocsc()
+        return {
+            'recipe_ids': recipe_ids,
+            'row_ptr': rows.indptr,
+            'row_cols': row_cols,
+            'ingredient_ids': ingredient_ids,
+            'idf': idf,
+            'col_ptr': columns.indptr,
+            'col_rows': columns.indices,
+            'col_weights': columns.data,
+        }
+
+    def write(self, built_at, total, arrays):
+        os.makedirs(self.root, exist_ok=True)
+        building = tempfile.mkdtemp(prefix='.', dir=self.root)
+        for key, values in arrays.items():
+            with open(os.path.join(building, key), 'wb') as file:
+                np.asarray(values, dtype=ARRAYS[key]).tofile(file)
+        with open(os.path.join(building, 'meta.json'), 'w') as file:
+            json.dump(
+                {'built_at': built_at.isoformat(), 'recipes': total}, file
+            )
+        name = built_at.strftime('%Y%m%d%H%M%S%f')
+        os.rename(building, os.path.join(self.root, name))
+        descriptor, pointer = tempfile.mkstemp(prefix='.', dir=self.root)
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(name)
+        os.replace(pointer, os.path.join(self.root, CURRENT))
+        # Processes that loaded the previous build keep reading it until
+        # they notice the new pointer, so only older builds are removed.
+        builds = sorted(
+            entry for entry in os.listdir(self.root)
+            if not entry.startswith('.') and entry <= name
+            and os.path.isdir(os.path.join(self.root, entry))
+        )
+        for stale in builds[:-KEEP_BUILDS]:
+            shutil.rmtree(os.path.join(self.root, stale), ignore_errors=True)
+
+    def similar(self, recipe, limit):
+        _, index = self.get()
+        if index is None:
+            return None
+        recipe_ids = index['recipe_ids']
+        col_ptr = index['col_ptr']
+        cols = np.unique(find(
+            index['ingredient_ids'],
+            list(recipe.ingredient_for_recipe.values_list(
+                'ingredient_id', flat=True
+            )),
+        ))
+        weights = index['idf'][cols].astype(np.float64)
+        norm = math.sqrt(float(weights @ weights)) or 1
+        max_df = settings.SIMILAR_RECIPES_MAX_DF * len(recipe_ids)
+        common = col_ptr[cols + 1] - col_ptr[cols] > max_df
+        scores = index['matrix'][:, cols[~common]] @ (weights[~common] / norm)
+        scores[find(recipe_ids, [recipe.pk])] = 0
+        rows = np.flatnonzero(scores > 0)
+        if len(rows) > limit * 3:
+            rows = rows[np.argpartition(-scores[rows], limit * 3 - 1)]
+            rows = rows[:limit * 3]
+        candidates = {
+            int(recipe_ids[row]): float(scores[row]) for row in rows
+        }
+        shared_tags = dict(
+            Recipe.tags.through.objects.filter(
+                recipe__in=candidates,
+                tag__in=recipe.tags.values('pk'),
+            ).values('recipe').annotate(
+                shared=Count('pk')
+            ).values_list('recipe', 'shared').order_by()
+        )
+        return sorted(
+            candidates,
+            key=lambda pk: (
+                -round(candidates[pk], 6), -shared_tags.get(pk, 0), pk
+            ),
+        )[:limit]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, prefix='images', **kwargs):
+        self.prefix = prefix
+        super().__init__(**kwargs)
+
+    def hashed_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        digest = sha256.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return (
+            f'{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+        )
+
+    def get_available_name(self, name, max_length=None):
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return self.save_once(
+            self.hashed_name(name, content), content, max_length
+        )
+
+    def save_once(self, name, content, max_length=None):
+        try:
+            return super().save(name, content, max_length)
+        except FileExistsError:
+            pass
+        try:
+            # Mark the blob as fresh so the garbage collector's --min-age
+            # guard protects it until the new reference is committed.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+
+recipe_image_storage = ContentAddressedStorage()
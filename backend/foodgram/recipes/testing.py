@@ -0,0 +1,61 @@
+import tempfile
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient, IngridientForRecipe, Recipe, Tag
+from users.models import User
+
+
+def count_queries(client, path, params=None):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(path, params)
+    return response, len(queries)
+
+
+class RecipeFixtures:
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+        self.user = self.create_user('cook')
+        self.tags = [
+            Tag.objects.create(name=f'tag{number}', slug=f'tag{number}',
+                               color=f'#00000{number}')
+            for number in range(2)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'ingredient{number}',
+                                      measurement_unit='г')
+            for number in range(8)
+        ]
+
+    def use_temporary_media(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_user(self, username, **fields):
+        return User.objects.create_user(
+            email=f'{username}@example.com', username=username,
+            first_name='Имя', last_name='Фамилия', password='secret-pass-1',
+            **fields,
+        )
+
+    def create_recipe(self, ingredients=None, name='recipe', author=None,
+                      tags=None, amount=10):
+        recipe = Recipe.objects.create(
+            author=author or self.user, name=name, text='text',
+            cooking_time=5, image='recipes/images/recipe.png',
+        )
+        recipe.tags.set(self.tags if tags is None else tags)
+        for ingredient in (self.ingredients[:3] if ingredients is None
+                           else ingredients):
+            IngridientForRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+        return recipe
@@ -0,0 +1,480 @@
+import io
+import json
+import os
+import random
+import tempfile
+from collections import defaultdict
+from unittest import mock
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from recipes.images import rendition_name
+from recipes.management.commands.load_ingredients import iter_json_array
+from recipes.models import (Cart, CartTotal, DeletedRecipe, Favorite,
+                            Ingredient, IngridientForRecipe, Recipe)
+from recipes.pantry import PantryIndex
+from recipes.similarity import ARRAYS, SimilarityIndex
+from recipes.storage import recipe_image_storage
+from recipes.testing import RecipeFixtures
+from users.models import Subscribe, User
+
+
+class IterJsonArrayTests(TestCase):
+    def test_matches_json_load_for_any_chunk_size(self):
+        rows = [
+            {'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+            for number in range(50)
+        ]
+        text = json.dumps(rows, ensure_ascii=False, indent=2)
+        for chunk_size in (1, 7, 4096):
+            self.assertEqual(
+                list(iter_json_array(io.StringIO(text), chunk_size)), rows
+            )
+        self.assertEqual(list(iter_json_array(io.StringIO(' [ ] '))), [])
+
+    def test_rejects_malformed_input(self):
+        for text in ('{}', '[{"a": 1}', '[{"a": 1} {"b": 2}]'):
+            with self.assertRaises(ValueError):
+                list(iter_json_array(io.StringIO(text), 3))
+
+
+class CartTotalTests(RecipeFixtures, TestCase):
+    def assert_totals_match_carts(self):
+        expected = {
+            (row['recipe__cart__user'], row['ingredient']): row['total']
+            for row in CartTotal.objects.aggregate_carts()
+        }
+        self.assertEqual(
+            {
+                (user, ingredient): amount
+                for user, ingredient, amount in CartTotal.objects.values_list(
+                    'user', 'ingredient', 'amount'
+                )
+            },
+            expected,
+        )
+        return expected
+
+    def test_totals_follow_cart_and_recipe_changes(self):
+        first = self.create_recipe(self.ingredients[:3], amount=10)
+        second = self.create_recipe(self.ingredients[2:5], amount=5)
+        user, other = self.user, self.create_user('other')
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.add(user, first.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.add_many(user, [first.pk, second.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.add_many(other, [second.pk])
+        totals = self.assert_totals_match_carts()
+        self.assertEqual(totals[user.pk, self.ingredients[2].pk], 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            IngridientForRecipe.objects.filter(
+                recipe=second, ingredient=self.ingredients[2]
+            ).delete()
+            IngridientForRecipe.objects.create(
+                recipe=second, ingredient=self.ingredients[7], amount=3
+            )
+        totals = self.assert_totals_match_carts()
+        self.assertEqual(totals[user.pk, self.ingredients[2].pk], 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.remove(user, first.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.assert_totals_match_carts(), {})
+
+    def test_refresh_repairs_existing_rows_in_place(self):
+        recipe = self.create_recipe(self.ingredients[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            Cart.objects.add(self.user, recipe.pk)
+        CartTotal.objects.filter(ingredient=self.ingredients[0]).update(
+            amount=1
+        )
+        CartTotal.objects.create(
+            user=self.user, ingredient=self.ingredients[5], amount=7
+        )
+        CartTotal.objects.refresh([self.user.pk])
+        CartTotal.objects.refresh()
+        self.assertEqual(self.assert_totals_match_carts(), {
+            (self.user.pk, self.ingredients[0].pk): 10,
+            (self.user.pk, self.ingredients[1].pk): 10,
+        })
+
+
+class CounterTests(RecipeFixtures, TestCase):
+    def counters(self, recipe):
+        recipe.refresh_from_db()
+        self.user.refresh_from_db()
+        return (recipe.favorites_count, recipe.carts_count,
+                self.user.recipes_count, self.user.subscribers_count)
+
+    def test_counters_follow_changes_and_reconcile(self):
+        recipe = self.create_recipe()
+        other = self.create_user('other')
+        Subscribe.objects.create(user=other, author=self.user)
+        Favorite.objects.create(user=other, recipe=recipe)
+        Cart.objects.add_many(other, [recipe.pk])
+        Cart.objects.add_many(self.user, [recipe.pk])
+        self.assertEqual(self.counters(recipe), (1, 2, 1, 1))
+        Cart.objects.remove(other, recipe.pk)
+        self.assertEqual(self.counters(recipe), (1, 1, 1, 1))
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+        output = io.StringIO()
+        call_command('reconcile_counters', '--check', stdout=output)
+        self.assertIn(
+            'Recipe.favorites_count: расхождений 1', output.getvalue()
+        )
+        self.assertEqual(self.counters(recipe), (5, 1, 1, 1))
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(self.counters(recipe), (1, 1, 1, 1))
+
+
+class ImageStorageTests(RecipeFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media()
+
+    def save(self, content):
+        return recipe_image_storage.save('image.png', ContentFile(content))
+
+    def test_reused_blob_is_marked_fresh(self):
+        name = self.save(b'image')
+        path = recipe_image_storage.path(name)
+        os.utime(path, (0, 0))
+        self.assertEqual(self.save(b'image'), name)
+        self.assertGreater(os.path.getmtime(path), 0)
+
+    def test_save_once_keeps_the_requested_name(self):
+        name = 'renditions/images/ab/cd/abcd_240q80.jpeg'
+        for content in (b'first', b'second'):
+            self.assertEqual(
+                recipe_image_storage.save_once(name, ContentFile(content)),
+                name,
+            )
+        self.assertEqual(
+            recipe_image_storage.listdir('renditions/images/ab/cd'),
+            ([], ['abcd_240q80.jpeg']),
+        )
+        with recipe_image_storage.open(name) as file:
+            self.assertEqual(file.read(), b'first')
+
+    def test_garbage_collection_keeps_referenced_blobs(self):
+        kept = self.save(b'kept')
+        removed = self.save(b'removed')
+        for name in (kept, removed):
+            os.utime(recipe_image_storage.path(name), (0, 0))
+        stem = os.path.splitext(kept)[0]
+        renditions = (
+            rendition_name(kept, 240, 'jpeg'), f'renditions/{stem}_240.jpeg'
+        )
+        for name in renditions:
+            recipe_image_storage.save_once(name, ContentFile(b'rendition'))
+            os.utime(recipe_image_storage.path(name), (0, 0))
+        recipe = self.create_recipe([])
+        Recipe.objects.filter(pk=recipe.pk).update(image=kept)
+        call_command('collect_image_garbage', stdout=io.StringIO())
+        self.assertTrue(recipe_image_storage.exists(kept))
+        self.assertFalse(recipe_image_storage.exists(removed))
+        self.assertTrue(recipe_image_storage.exists(renditions[0]))
+        self.assertFalse(recipe_image_storage.exists(renditions[1]))
+
+
+class RecipeSearchTests(RecipeFixtures, TestCase):
+    def create_named(self, name, text):
+        recipe = self.create_recipe([])
+        recipe.name = name
+        recipe.text = text
+        recipe.save()
+        return recipe
+
+    def found(self, query):
+        return set(Recipe.objects.search(query).values_list('pk', flat=True))
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        soup = self.create_named('борщ', 'свекла капуста')
+        stew = self.create_named('рагу', 'капуста морковь')
+        self.assertEqual(self.found('капуста'), {soup.pk, stew.pk})
+        self.assertEqual(self.found('борщ'), {soup.pk})
+        self.assertEqual(self.found('борщ капуста'), {soup.pk})
+        stew.name = 'борщ'
+        stew.save()
+        self.assertEqual(self.found('борщ'), {soup.pk, stew.pk})
+        soup.delete()
+        self.assertEqual(self.found('борщ'), {stew.pk})
+        self.assertEqual(self.found('свекла'), set())
+
+    def test_quotes_in_query_are_not_syntax(self):
+        self.create_named('борщ', 'текст')
+        self.assertEqual(self.found('"борщ'), self.found('борщ'))
+
+
+class RecipeTransferTests(RecipeFixtures, TestCase):
+    def test_reimport_skips_recipes_already_loaded(self):
+        for name in ('борщ', 'рагу', 'каша'):
+            recipe = self.create_recipe(self.ingredients[:2])
+            Recipe.objects.filter(pk=recipe.pk).update(name=name)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            call_command('export_recipes', path, stderr=io.StringIO())
+            Recipe.objects.filter(name='рагу').delete()
+            call_command('import_recipes', path, stdout=io.StringIO())
+            call_command('import_recipes', path, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            ['борщ', 'каша', 'рагу'],
+        )
+        self.assertEqual(
+            Recipe.objects.get(name='рагу').ingredients.count(), 2
+        )
+
+    def test_imported_recipes_reach_incremental_similarity_rebuild(self):
+        self.create_recipe()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        index = SimilarityIndex(directory.name)
+        index.rebuild(full=True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            call_command('export_recipes', path, stderr=io.StringIO())
+            Recipe.objects.all().delete()
+            call_command('import_recipes', path, stdout=io.StringIO())
+        self.assertEqual(index.rebuild(), 1)
+        self.assertEqual(
+            list(index.build()['recipe_ids']),
+            list(Recipe.objects.values_list('pk', flat=True)),
+        )
+
+    def test_tag_conflict_names_the_row(self):
+        row = {
+            'name': 'борщ', 'text': 'text', 'cooking_time': 5,
+            'image': 'recipes/images/recipe.png',
+            'author': {'email': 'new@example.com', 'username': 'new',
+                       'first_name': 'Имя', 'last_name': 'Фамилия'},
+            'tags': [], 'ingredients': [],
+        }
+        conflicting = dict(row, tags=[
+            {'name': 'new', 'slug': 'new', 'color': self.tags[0].color}
+        ])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                for line in (row, {}, conflicting):
+                    file.write(json.dumps(line) + '\n' if line else '\n')
+            with self.assertRaisesMessage(CommandError, 'Строка 3: '):
+                call_command('import_recipes', path, stdout=io.StringIO())
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(SIMILAR_RECIPES_MAX_DF=1)
+class SimilarityIndexTests(RecipeFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = self.temporary_index()
+
+    def temporary_index(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return SimilarityIndex(directory.name)
+
+    def test_incremental_rebuild_matches_full_rebuild(self):
+        first, second, third = (
+            self.create_recipe(self.ingredients[start:start + 3])
+            for start in range(3)
+        )
+        self.index.rebuild(full=True)
+        IngridientForRecipe.objects.create(
+            recipe=first, ingredient=self.ingredients[7], amount=1
+        )
+        second.delete()
+        self.create_recipe(self.ingredients[4:])
+        Ingredient.objects.create(name='new', measurement_unit='г')
+        self.assertEqual(self.index.rebuild(), 3)
+        full = self.temporary_index()
+        full.rebuild(full=True)
+        incremental, expected = self.index.build(), full.build()
+        for name in ARRAYS:
+            np.testing.assert_array_equal(incremental[name], expected[name])
+        self.assertEqual(
+            list(incremental['recipe_ids']),
+            [first.pk, third.pk, third.pk + 1],
+        )
+
+    def test_similar_ranks_by_shared_ingredients(self):
+        recipe = self.create_recipe(self.ingredients[:3])
+        same = self.create_recipe(self.ingredients[:3])
+        close = self.create_recipe(self.ingredients[:2])
+        self.create_recipe(self.ingredients[5:])
+        self.index.rebuild(full=True)
+        self.assertEqual(self.index.similar(recipe, 10), [same.pk, close.pk])
+        self.assertEqual(self.index.similar(recipe, 1), [same.pk])
+
+    def test_reloads_only_when_a_new_build_is_published(self):
+        self.create_recipe()
+        self.assertEqual(self.index.get(), (None, None))
+        self.index.rebuild(full=True)
+        version, value = self.index.get()
+        with mock.patch.object(
+            self.index, 'build', side_effect=AssertionError
+        ):
+            self.assertIs(self.index.get()[1], value)
+        self.index.rebuild()
+        self.assertNotEqual(self.index.get()[0], version)
+
+    def test_keeps_current_and_previous_builds(self):
+        self.create_recipe()
+        versions = []
+        for _ in range(4):
+            self.index.rebuild()
+            versions.append(self.index.current())
+        self.assertEqual(
+            sorted(
+                entry for entry in os.listdir(self.index.root)
+                if entry != 'current'
+            ),
+            versions[-2:],
+        )
+        self.assertEqual(len(self.index.build()['recipe_ids']), 1)
+
+    def test_falls_back_to_full_rebuild_without_deletion_log(self):
+        first, second = self.create_recipe(), self.create_recipe()
+        self.index.rebuild(full=True)
+        second.delete()
+        DeletedRecipe.objects.all().delete()
+        with mock.patch.object(DeletedRecipe.objects, 'covers',
+                               return_value=False):
+            self.assertEqual(self.index.rebuild(), 1)
+        self.assertEqual(list(self.index.build()['recipe_ids']), [first.pk])
+
+
+class PantryIndexTests(RecipeFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = PantryIndex()
+        self.random = random.Random(25)
+
+    def create_random_recipes(self, number):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [
+                self.create_recipe(self.random.sample(
+                    self.ingredients, self.random.randint(1, 6)
+                ))
+                for _ in range(number)
+            ]
+
+    def random_pantry(self):
+        return [
+            ingredient.pk for ingredient in self.random.sample(
+                self.ingredients, self.random.randint(1, 8)
+            )
+        ]
+
+    def expected(self, pantry, max_missing):
+        needed = defaultdict(set)
+        rows = IngridientForRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        for recipe_id, ingredient_id in rows:
+            needed[recipe_id].add(ingredient_id)
+        tiers = [[] for _ in range(max_missing + 1)]
+        for recipe_id in sorted(needed, reverse=True):
+            missing = len(needed[recipe_id] - set(pantry))
+            if needed[recipe_id] & set(pantry) and missing <= max_missing:
+                tiers[missing].append(recipe_id)
+        return tiers
+
+    def assert_coverage_matches_brute_force(self):
+        for _ in range(20):
+            pantry = self.random_pantry()
+            self.assertEqual(
+                [tier.tolist() for _, tier in self.index.coverage(pantry, 3)],
+                self.expected(pantry, 3),
+            )
+
+    def test_coverage_matches_brute_force(self):
+        self.create_random_recipes(150)
+        self.assert_coverage_matches_brute_force()
+
+    def test_changes_are_applied_without_rebuild(self):
+        recipes = self.create_random_recipes(100)
+        self.assert_coverage_matches_brute_force()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].delete()
+            IngridientForRecipe.objects.filter(recipe=recipes[1]).delete()
+            IngridientForRecipe.objects.filter(recipe=recipes[2]).first(
+            ).delete()
+            IngridientForRecipe.objects.get_or_create(
+                recipe=recipes[3], ingredient=self.ingredients[7],
+                defaults={'amount': 1},
+            )
+        self.create_random_recipes(10)
+        with mock.patch.object(
+            self.index, 'rebuild', side_effect=AssertionError
+        ):
+            self.assert_coverage_matches_brute_force()
+
+    def test_search_is_limited_to_candidates(self):
+        recipes = self.create_random_recipes(100)
+        pantry = [ingredient.pk for ingredient in self.ingredients]
+        self.assertEqual(
+            self.index.search(pantry, 0, 5),
+            [(recipe.pk, 0) for recipe in recipes[:-6:-1]],
+        )
+        candidates = [recipe.pk for recipe in recipes[:3]]
+        allowed = mock.Mock(side_effect=lambda ids: set(ids) & set(candidates))
+        self.assertEqual(
+            self.index.search(pantry, 0, 2, allowed),
+            [(candidates[2], 0), (candidates[1], 0)],
+        )
+        self.assertEqual(
+            [len(call.args[0]) for call in allowed.call_args_list],
+            [2, 4, 8, 16, 32, 38],
+        )
+
+    def test_sync_reloads_only_new_changes(self):
+        recipes = self.create_random_recipes(10)
+        self.index.sync()
+        with mock.patch.object(
+            self.index, 'apply', side_effect=AssertionError
+        ):
+            self.index.sync()
+        IngridientForRecipe.objects.filter(recipe=recipes[0]).delete()
+        with mock.patch.object(self.index, 'apply') as apply:
+            self.index.sync()
+        apply.assert_called_once_with({recipes[0].pk})
+
+
+class SeedDataTests(RecipeFixtures, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media()
+
+    def seed(self, *args):
+        call_command(
+            'seed_data', '--users=3', '--tags=2', '--recipes=4',
+            '--favorites=2', '--carts=2', '--subscriptions=2', *args,
+            stdout=io.StringIO(),
+        )
+
+    def test_clear_keeps_real_accounts_with_the_prefix(self):
+        real = self.create_user('seed_real')
+        recipe = self.create_recipe(author=real)
+        self.seed()
+        self.assertEqual(
+            User.objects.filter(username__startswith='seed_').count(), 4
+        )
+        self.seed('--clear', '--seed=1')
+        self.assertEqual(
+            set(User.objects.filter(
+                username__startswith='seed_'
+            ).values_list('username', flat=True)),
+            {'seed_real', 'seed_0', 'seed_1', 'seed_2'},
+        )
+        self.assertTrue(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertEqual(
+            Recipe.objects.exclude(author=real).exclude(
+                author=self.user
+            ).count(),
+            4,
+        )
@@ -0,0 +1,206 @@
+import gzip
+import io
+import json
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredient, IngridientForRecipe, Recipe, Tag
+from users.models import User
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@contextmanager
+def open_stream(path, mode):
+    if path == '-':
+        if mode == 'r':
+            yield io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            yield io.TextIOWrapper(
+                sys.stdout.buffer, encoding='utf-8', write_through=True
+            )
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode + 't', encoding='utf-8') as file:
+        yield file
+
+
+def recipe_chunks(chunk_size):
+    last = 0
+    while True:
+        recipes = list(
+            Recipe.objects.filter(pk__gt=last).select_related(
+                'author'
+            ).order_by('pk').defer('search_vector')[:chunk_size]
+        )
+        if not recipes:
+            return
+        last = recipes[-1].pk
+        yield recipes
+
+
+def export_rows(recipes):
+    ids = [recipe.pk for recipe in recipes]
+    tags = defaultdict(list)
+    for recipe_id, name, slug, color in Recipe.tags.through.objects.filter(
+        recipe__in=ids
+    ).values_list(
+        'recipe_id', 'tag__name', 'tag__slug', 'tag__color'
+    ).order_by('pk').iterator():
+        tags[recipe_id].append({'name': name, 'slug': slug, 'color': color})
+    ingredients = defaultdict(list)
+    for recipe_id, name, unit, amount in IngridientForRecipe.objects.filter(
+        recipe__in=ids
+    ).values_list(
+        'recipe_id', 'ingredient__name', 'ingredient__measurement_unit',
+        'amount',
+    ).order_by('pk').iterator():
+        ingredients[recipe_id].append(
+            {'name': name, 'measurement_unit': unit, 'amount': amount}
+        )
+    for recipe in recipes:
+        yield json.dumps({
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'author': {
+                field: getattr(recipe.author, field)
+                for field in AUTHOR_FIELDS
+            },
+            'tags': tags[recipe.pk],
+            'ingredients': ingredients[recipe.pk],
+        }, ensure_ascii=False)
+
+
+class RecipeImporter:
+    def __init__(self):
+        self.tags = {}
+        self.ingredients = {}
+        self.password = make_password(None)
+
+    def import_batch(self, start, lines):
+        rows = []
+        numbers = []
+        for number, line in enumerate(lines, start):
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as error:
+                    raise ValueError(f'Строка {number}: {error}')
+                numbers.append(number)
+        with transaction.atomic():
+            authors = self.resolve_authors(rows)
+            self.resolve_tags(rows, numbers)
+            self.resolve_ingredients(rows)
+            rows = [row for row in rows if row['author']['email'] in authors]
+            # Recipes already loaded by an earlier, partly failed run are
+            # skipped, so re-running an import does not duplicate them.
+            existing = set(Recipe.objects.filter(
+                author__in=set(authors.values()),
+                name__in={row['name'] for row in rows},
+            ).values_list('author_id', 'name'))
+            rows = [
+                row for row in rows
+                if (authors[row['author']['email']], row['name'])
+                not in existing
+            ]
+            recipes = [
+                Recipe(
+                    author_id=authors[row['author']['email']],
+                    name=row['name'],
+                    text=row['text'],
+                    cooking_time=row['cooking_time'],
+                    image=row['image'],
+                )
+                for row in rows
+            ]
+            if connection.features.can_return_rows_from_bulk_insert:
+                Recipe.objects.bulk_create(recipes)
+            else:
+                # SQLite in Django 3.2 cannot return ids from bulk inserts.
+                for recipe in recipes:
+                    recipe.save()
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(
+                    recipe_id=recipe.pk, tag_id=self.tags[tag['slug']]
+                )
+                for recipe, row in zip(recipes, rows)
+                for tag in row['tags']
+            )
+            IngridientForRecipe.objects.bulk_create(
+                IngridientForRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=self.ingredients[
+                        ingredient['name'], ingredient['measurement_unit']
+                    ],
+                    amount=ingredient['amount'],
+                )
+                for recipe, row in zip(recipes, rows)
+                for ingredient in row['ingredients']
+            )
+        return len(recipes), len(lines) - len(recipes)
+
+    # Shared rows are inserted in natural key order, so parallel workers
+    # take the unique index locks in the same order and cannot deadlock.
+    def resolve_authors(self, rows):
+        authors = {row['author']['email']: row['author'] for row in rows}
+        User.objects.bulk_create(
+            (
+                User(password=self.password, **{
+                    field: authors[email][field] for field in AUTHOR_FIELDS
+                })
+                for email in sorted(authors)
+            ),
+            ignore_conflicts=True,
+        )
+        return dict(
+            User.objects.filter(email__in=authors).values_list('email', 'id')
+        )
+
+    def resolve_tags(self, rows, numbers):
+        missing = {}
+        for number, row in zip(numbers, rows):
+            for tag in row['tags']:
+                if tag['slug'] not in self.tags:
+                    missing.setdefault(tag['slug'], (number, tag))
+        if not missing:
+            return
+        Tag.objects.bulk_create(
+            (Tag(**missing[slug][1]) for slug in sorted(missing)),
+            ignore_conflicts=True,
+        )
+        self.tags.update(
+            Tag.objects.filter(slug__in=missing).values_list('slug', 'id')
+        )
+        unresolved = sorted(set(missing) - set(self.tags))
+        if unresolved:
+            number, tag = missing[unresolved[0]]
+            raise CommandError(
+                f'Строка {number}: не удалось создать тег {tag["slug"]}, '
+                f'цвет {tag["color"]} уже занят другим тегом.'
+            )
+
+    def resolve_ingredients(self, rows):
+        missing = {
+            (ingredient['name'], ingredient['measurement_unit'])
+            for row in rows for ingredient in row['ingredients']
+        } - set(self.ingredients)
+        if not missing:
+            return
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in sorted(missing)
+            ),
+            ignore_conflicts=True,
+        )
+        for pk, name, unit in Ingredient.objects.filter(
+            name__in={name for name, _ in missing}
+        ).values_list('id', 'name', 'measurement_unit').iterator():
+            self.ingredients[name, unit] = pk
@@ -6,4 +6,4 @@ from .models import User
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('id', 'username', 'email', 'password',
-                    'is_staff',)
+                    'is_staff', 'recipes_count', 'subscribers_count',)
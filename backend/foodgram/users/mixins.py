@@ -0,0 +1,26 @@
+from .models import Subscribe
+
+
+class SubscriptionsContextMixin:
+    subscription_author_field = 'id'
+
+    def get_subscriptions(self, instance):
+        user = self.request.user
+        if not user.is_authenticated:
+            return set()
+        if not isinstance(instance, (list, tuple)):
+            instance = [instance]
+        authors = {
+            getattr(obj, self.subscription_author_field) for obj in instance
+        }
+        return set(Subscribe.objects.filter(
+            user=user, author__in=authors
+        ).values_list('author_id', flat=True))
+
+    def get_serializer(self, *args, **kwargs):
+        if args and args[0] is not None:
+            kwargs.setdefault('context', self.get_serializer_context())
+            kwargs['context']['subscriptions'] = self.get_subscriptions(
+                args[0]
+            )
+        return super().get_serializer(*args, **kwargs)
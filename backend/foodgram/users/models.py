@@ -35,6 +35,16 @@ class User(AbstractUser):
         blank=False,
         help_text="Обязательно для заполнения"
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username',
                        'first_name',
@@ -2,16 +2,19 @@ from djoser.serializers import UserSerializer
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 
+from api.fields import ImageRenditionsField
+from api.metrics import TimedListSerializer, TimedSerializerMixin
 from recipes.models import Recipe
 
 from .models import Subscribe, User
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = (
             'email',
             'id',
@@ -25,13 +28,16 @@ class CustomUserSerializer(UserSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is not None:
+            return obj.id in subscriptions
         return Subscribe.objects.filter(user=request.user,
                                         author=obj).exists()
 
 
 class SubscribeSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(CustomUserSerializer.Meta):
         fields = CustomUserSerializer.Meta.fields + (
@@ -60,9 +66,6 @@ class SubscribeSerializer(CustomUserSerializer):
 
         return data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
     def get_recipes(self, obj):
         recipes = obj.recipes.all()
         serializer = RecipeAddSerializer(recipes, many=True, read_only=True)
@@ -70,6 +73,7 @@ class SubscribeSerializer(CustomUserSerializer):
 
 
 class RecipeAddSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
@@ -77,5 +81,6 @@ class RecipeAddSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_renditions',
             'cooking_time'
         )
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.cache import (AUTHORS_VERSION_KEY, bump_version, touch_timestamp,
+                           user_flags_key)
+from recipes.counters import change_counter
+from users.models import Subscribe, User
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Subscribe)
+def increment_subscribers_count(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'subscribers_count', 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def decrement_subscribers_count(instance, **kwargs):
+    change_counter(User, instance.author_id, 'subscribers_count', -1)
+
+
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def touch_user_flags(instance, **kwargs):
+    touch_timestamp(user_flags_key(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(update_fields, **kwargs):
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        bump_version(AUTHORS_VERSION_KEY)
@@ -0,0 +1,84 @@
+from rest_framework.test import APITestCase
+
+from recipes.testing import RecipeFixtures, count_queries
+from users.models import Subscribe
+
+
+class UserListTests(RecipeFixtures, APITestCase):
+    def create_authors(self, number):
+        authors = [
+            self.create_user(f'author{self.authors + index}')
+            for index in range(number)
+        ]
+        self.authors += number
+        return authors
+
+    def setUp(self):
+        super().setUp()
+        self.authors = 0
+        # Djoser lists only the viewer to non-staff users.
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+
+    def test_is_subscribed_without_a_query_per_user(self):
+        followed, other = self.create_authors(2)
+        Subscribe.objects.create(user=self.user, author=followed)
+        response, queries = count_queries(self.client, '/api/users/')
+        flags = {
+            user['id']: user['is_subscribed']
+            for user in response.data['results']
+        }
+        self.assertEqual(flags, {
+            self.user.pk: False, followed.pk: True, other.pk: False,
+        })
+        for author in self.create_authors(3):
+            Subscribe.objects.create(user=self.user, author=author)
+        response, more_queries = count_queries(self.client, '/api/users/')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(more_queries, queries)
+
+
+class SubscriptionListTests(RecipeFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def subscribe(self, username, recipes):
+        author = self.create_user(username)
+        for number in range(recipes):
+            self.create_recipe(name=f'{username}{number}', author=author)
+        Subscribe.objects.create(user=self.user, author=author)
+        return author
+
+    def test_recipes_limit_keeps_the_newest_recipes(self):
+        author = self.subscribe('author', 3)
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        [subscription] = response.data['results']
+        self.assertEqual(subscription['id'], author.pk)
+        self.assertEqual(subscription['recipes_count'], 3)
+        self.assertEqual(
+            [recipe['name'] for recipe in subscription['recipes']],
+            ['author2', 'author1'],
+        )
+
+    def test_query_count_does_not_grow_with_authors(self):
+        self.subscribe('first', 2)
+        path = '/api/users/subscriptions/'
+        _, queries = count_queries(self.client, path, {'recipes_limit': 1})
+        for username in ('second', 'third'):
+            self.subscribe(username, 2)
+        response, more_queries = count_queries(
+            self.client, path, {'recipes_limit': 1}
+        )
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(more_queries, queries)
+
+    def test_rejects_invalid_recipes_limit(self):
+        for recipes_limit in ('0', '-1', 'two'):
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': recipes_limit}
+            )
+            self.assertEqual(response.status_code, 400)
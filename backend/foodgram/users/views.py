@@ -1,26 +1,53 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from recipes.models import Recipe
 from users.serializers import SubscribeSerializer
 
+from .mixins import SubscriptionsContextMixin
 from .models import Subscribe, User
 from .serializers import CustomUserSerializer
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(SubscriptionsContextMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        if not recipes_limit.isdigit() or int(recipes_limit) < 1:
+            raise ValidationError(
+                {'recipes_limit': 'Введите целое число > 0.'}
+            )
+        return int(recipes_limit)
+
+    def with_recipes(self, queryset):
+        recipes = Recipe.objects.previews()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.latest_per_author(recipes_limit)
+        return queryset.prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        )
+
     @action(
         detail=True,
         methods=('post',),
         permission_classes=(permissions.IsAuthenticated,)
     )
+    @transaction.atomic
     def subscribe(self, request, id=None):
-        follower = get_object_or_404(User, id=id)
+        follower = get_object_or_404(
+            self.with_recipes(User.objects.all()), id=id
+        )
         serializer = SubscribeSerializer(
             follower,
             data=request.data,
@@ -42,6 +69,14 @@ class UserViewSet(UserViewSet):
             permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
         pages = self.paginate_queryset(
-            User.objects.filter(author__user=request.user))
-        serializer = SubscribeSerializer(pages, many=True)
+            self.with_recipes(User.objects.filter(author__user=request.user))
+        )
+        serializer = SubscribeSerializer(
+            pages,
+            many=True,
+            context={
+                'request': request,
+                'subscriptions': {author.id for author in pages},
+            }
+        )
         return self.get_paginated_response(serializer.data)